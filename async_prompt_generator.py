@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Asyncio client for the Uncensored Prompt Generator
+Mirrors the PromptGenerator API on top of a pooled httpx.AsyncClient
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Optional, Union
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+from circuit_breaker import CircuitBreaker
+from image_preprocessing import ImagePreprocessor
+from ollama_pool import parse_hosts
+from prompt_generator import (
+    HTTP_RETRIES,
+    MODEL_CACHE_ERROR_TTL,
+    MODEL_CACHE_TTL,
+    NUM_PARALLEL,
+    POOL_SIZE,
+    CircuitOpenError,
+    GenerationTimeout,
+    OllamaError,
+    ImageSource,
+    PromptBuilder,
+    Timeouts,
+    keep_alive_config,
+)
+
+
+class AsyncPromptGenerator(PromptBuilder):
+    """Asyncio counterpart of PromptGenerator.
+
+    Construction does no I/O; models are detected on first use (or by
+    awaiting detect_models()). Use it as an async context manager, or
+    call aclose() when done. Cancelling a coroutine closes its upstream
+    request.
+    """
+
+    def __init__(self,
+                 ollama_host: str = None,
+                 model_cache_ttl: Optional[float] = None,
+                 pool_size: int = POOL_SIZE,
+                 retries: int = HTTP_RETRIES,
+                 num_parallel: int = NUM_PARALLEL,
+                 image_preprocessor: Optional[ImagePreprocessor] = None,
+                 keep_alive: Union[str, int, float, dict, None] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 timeouts: Optional[Timeouts] = None):
+        if httpx is None:
+            raise ImportError("AsyncPromptGenerator requires httpx: pip install httpx")
+
+        # Support environment variable for Docker/custom setups; this client
+        # talks to one host, the first of a comma-separated OLLAMA_HOST
+        self.ollama_host = parse_hosts(ollama_host or os.getenv("OLLAMA_HOST", "http://localhost:11434"))[0]
+
+        # Connect/first-token/total limits for generations (OLLAMA_*TIMEOUT settings)
+        self.timeouts = timeouts or Timeouts()
+
+        # Pooled keep-alive client used for all Ollama traffic; transport
+        # retries only cover connection failures, so they are safe for POST
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+            timeout=httpx.Timeout(self.timeouts.requests_timeout()[1], connect=self.timeouts.connect)
+        )
+        self.num_parallel = max(1, num_parallel)
+
+        # Fail fast while Ollama keeps failing or timing out (OLLAMA_BREAKER_* settings)
+        self.breaker = breaker or CircuitBreaker.from_env()
+
+        # Downscale/re-encode images before vision calls (PROMPT_IMAGE_* settings)
+        self.image_preprocessor = image_preprocessor or ImagePreprocessor.from_env()
+
+        # How long Ollama keeps each model loaded (OLLAMA_*KEEP_ALIVE settings)
+        self.keep_alive = keep_alive_config(keep_alive)
+
+        # Model catalog cache
+        self.model_cache_ttl = MODEL_CACHE_TTL if model_cache_ttl is None else model_cache_ttl
+        self._models = None
+        self._models_connected = False
+        self._models_fetched_at = 0.0
+        self._models_inflight = None
+
+        self.text_model = None
+        self.vision_model = None
+
+    async def aclose(self):
+        """Close pooled connections"""
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        await self.detect_models()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def detect_models(self):
+        """Pick the default text and vision models from the installed ones"""
+        models = await self.list_models()
+        self.text_model = self._find_best_text_model(models)
+        self.vision_model = self._find_best_vision_model(models)
+
+    async def _ensure_models(self):
+        if self.text_model is None or self.vision_model is None:
+            await self.detect_models()
+
+    async def check_ollama_connection(self) -> bool:
+        """Check if Ollama is running (based on the last model list refresh)"""
+        return (await self._get_model_catalog())[1]
+
+    def invalidate_model_cache(self):
+        """Drop the cached model list so the next caller fetches a fresh one"""
+        self._models = None
+        self._models_fetched_at = 0.0
+        self._models_inflight = None
+
+    async def list_models(self, refresh: bool = False) -> list:
+        """List available Ollama models (cached for model_cache_ttl seconds).
+
+        Concurrent callers share one in-flight /api/tags request.
+        """
+        return (await self._get_model_catalog(refresh=refresh))[0]
+
+    async def _get_model_catalog(self, refresh: bool = False) -> tuple:
+        """Return (model names, reachable), refreshing the cache once if stale.
+
+        Both values come from the same fetch, even if the cache is
+        invalidated while it is in flight.
+        """
+        if self._models is not None and not refresh:
+            ttl = self.model_cache_ttl if self._models_connected else min(
+                self.model_cache_ttl, MODEL_CACHE_ERROR_TTL)
+            if time.monotonic() - self._models_fetched_at < ttl:
+                return list(self._models), self._models_connected
+
+        if self._models_inflight is None:
+            self._models_inflight = asyncio.ensure_future(self._refresh_models())
+        fetch = self._models_inflight
+
+        # Shield so one cancelled caller does not cancel the shared fetch
+        models, connected = await asyncio.shield(fetch)
+        return list(models), connected
+
+    async def _refresh_models(self) -> tuple:
+        models, connected = await self._fetch_models()
+        # Only publish if nobody invalidated the cache meanwhile
+        if self._models_inflight is asyncio.current_task():
+            self._models = models
+            self._models_connected = connected
+            self._models_fetched_at = time.monotonic()
+            self._models_inflight = None
+        return models, connected
+
+    async def _fetch_models(self) -> tuple:
+        """Query /api/tags, returning (model names, reachable)"""
+        try:
+            response = await self.client.get(f"{self.ollama_host}/api/tags", timeout=10)
+            if response.status_code == 200:
+                return [model['name'] for model in response.json().get('models', [])], True
+            print(f"Warning: Could not list models: HTTP {response.status_code}")
+        except httpx.HTTPError as e:
+            print(f"Warning: Could not list models: {e}")
+        except Exception as e:
+            print(f"Warning: Unexpected error listing models: {e}")
+        return [], False
+
+    async def test_ollama_connection(self) -> dict:
+        """Test Ollama connection with detailed diagnostics"""
+        result = {
+            'success': False,
+            'ollama_host': self.ollama_host,
+            'error': None,
+            'error_type': None,
+            'models_count': 0,
+            'response_time_ms': 0
+        }
+
+        start_time = time.time()
+
+        try:
+            response = await self.client.get(f"{self.ollama_host}/api/tags", timeout=10)
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+
+            if response.status_code == 200:
+                models = response.json().get('models', [])
+                result['success'] = True
+                result['models_count'] = len(models)
+
+                # A successful probe is as good as a refresh of the model cache
+                self._models = [model['name'] for model in models]
+                self._models_connected = True
+                self._models_fetched_at = time.monotonic()
+            else:
+                result['error'] = f"HTTP {response.status_code}: {response.text[:200]}"
+                result['error_type'] = 'http_error'
+
+        except httpx.ConnectError:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = f"Connection refused - Ollama may not be running at {self.ollama_host}"
+            result['error_type'] = 'connection_refused'
+        except httpx.TimeoutException:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = f"Connection timed out after 10 seconds"
+            result['error_type'] = 'timeout'
+        except (httpx.InvalidURL, httpx.UnsupportedProtocol):
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = f"Invalid URL: {self.ollama_host}"
+            result['error_type'] = 'invalid_url'
+        except Exception as e:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = str(e)
+            result['error_type'] = 'unknown'
+
+        return result
+
+    async def set_ollama_host(self, host: str) -> dict:
+        """Update Ollama host and re-detect models"""
+        old_host = self.ollama_host
+        self.ollama_host = host.rstrip('/')
+        self.invalidate_model_cache()
+
+        # Test the new connection
+        test_result = await self.test_ollama_connection()
+
+        if test_result['success']:
+            self.breaker.reset()
+            # Re-detect models with new host
+            await self.detect_models()
+            return {
+                'success': True,
+                'ollama_host': self.ollama_host,
+                'text_model': self.text_model,
+                'vision_model': self.vision_model,
+                'models_count': test_result['models_count']
+            }
+        else:
+            # Revert to old host on failure
+            self.ollama_host = old_host
+            self.invalidate_model_cache()
+            return {
+                'success': False,
+                'error': test_result['error'],
+                'error_type': test_result['error_type']
+            }
+
+    async def encode_image_async(self, image_path: ImageSource) -> str:
+        """Encode image to base64 without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.encode_image, image_path)
+
+    async def _build_payload(self,
+                             user_input: str,
+                             prompt_type: str,
+                             image_path: Optional[ImageSource],
+                             model_override: Optional[str],
+                             word_limit: int,
+                             target_model: str,
+                             stream: bool) -> dict:
+        await self._ensure_models()
+        image_data = await self.encode_image_async(image_path) if image_path else None
+        return self._build_generate_payload(
+            user_input, prompt_type, image_data, model_override, word_limit, target_model, stream
+        )
+
+    def _allow_request(self):
+        """Raise CircuitOpenError instead of sending a generation while the circuit is open"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.status())
+
+    def _record_response(self, error: Optional[Exception], status_code: Optional[int] = None):
+        """Report a generation's outcome to the circuit breaker: transport errors and 5xx answers count against it"""
+        if error is None and status_code is not None and status_code >= 500:
+            error = OllamaError(f"HTTP {status_code}")
+        if error is None:
+            self.breaker.success()
+        else:
+            self.breaker.failure(error)
+
+    async def _post_generate(self, payload: dict) -> dict:
+        """POST a non-streaming /api/generate request and return the parsed result"""
+        self._allow_request()
+        try:
+            response = await asyncio.wait_for(
+                self.client.post(f"{self.ollama_host}/api/generate", json=self._with_keep_alive(payload)),
+                self.timeouts.total
+            )
+        except asyncio.TimeoutError:
+            error = GenerationTimeout(f"Error: Generation timed out after {self.timeouts.total:g}s")
+            self._record_response(error)
+            raise error
+        except httpx.HTTPError as e:
+            self._record_response(e)
+            raise
+        self._record_response(None, response.status_code)
+
+        if response.status_code != 200:
+            raise OllamaError(f"Error: {response.status_code} - {response.text}")
+
+        result = response.json()
+        result['response'] = result.get('response', '').strip()
+        return result
+
+    async def generate_prompt(self,
+                              user_input: str,
+                              prompt_type: str = "image",
+                              image_path: Optional[ImageSource] = None,
+                              model_override: Optional[str] = None,
+                              word_limit: int = 50,
+                              target_model: str = "stable-diffusion") -> str:
+        """Generate uncensored prompt using Ollama with target model optimization"""
+        payload = await self._build_payload(
+            user_input, prompt_type, image_path, model_override, word_limit, target_model, stream=False
+        )
+
+        # Send request to Ollama
+        try:
+            return (await self._post_generate(payload))['response']
+        except OllamaError as e:
+            return str(e)
+        except Exception as e:
+            return f"Error generating prompt: {str(e)}"
+
+    async def generate_prompt_stream(self,
+                                     user_input: str,
+                                     prompt_type: str = "image",
+                                     image_path: Optional[ImageSource] = None,
+                                     model_override: Optional[str] = None,
+                                     word_limit: int = 50,
+                                     target_model: str = "stable-diffusion") -> AsyncIterator[str]:
+        """Async generator yielding tokens as Ollama produces them.
+
+        Raises OllamaError if Ollama returns an error (CircuitOpenError
+        while the circuit breaker is open). Closing the generator early
+        closes the upstream connection.
+        """
+        payload = await self._build_payload(
+            user_input, prompt_type, image_path, model_override, word_limit, target_model, stream=True
+        )
+
+        self._allow_request()
+        error = None
+        status_code = None
+        deadline = time.monotonic() + self.timeouts.total if self.timeouts.total else None
+        try:
+            async with self.client.stream("POST", f"{self.ollama_host}/api/generate", json=self._with_keep_alive(payload)) as response:
+                status_code = response.status_code
+                if response.status_code != 200:
+                    await response.aread()
+                    raise OllamaError(f"Error: {response.status_code} - {response.text}")
+
+                started = False
+                async for line in response.aiter_lines():
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise GenerationTimeout(f"Error: Generation timed out after {self.timeouts.total:g}s")
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise OllamaError(f"Error: {chunk['error']}")
+                    token = chunk.get('response', '')
+                    if not started:
+                        # Match generate_prompt, which strips leading whitespace
+                        token = token.lstrip()
+                    if token:
+                        started = True
+                        yield token
+                    if chunk.get('done'):
+                        break
+        except (httpx.HTTPError, GenerationTimeout) as e:
+            error = e
+            raise
+        finally:
+            # A call cancelled before Ollama answered says nothing about its health
+            if error is not None or status_code is not None:
+                self._record_response(error, status_code)
+
+    async def enhance_prompt(self, base_prompt: str, style: Optional[str] = None) -> str:
+        """Enhance an existing prompt with additional details"""
+        enhancement_request = f"Enhance this prompt with more vivid details"
+        if style:
+            enhancement_request += f" in {style} style"
+        enhancement_request += f": {base_prompt}"
+
+        return await self.generate_prompt(enhancement_request)
+
+    async def breakdown_image_prompt(self,
+                                     user_input: str,
+                                     image_path: ImageSource,
+                                     prompt_type: str = "image",
+                                     model_override: Optional[str] = None,
+                                     word_limit: int = 50,
+                                     target_model: str = "stable-diffusion",
+                                     parallel: Optional[bool] = None) -> dict:
+        """Break down an image into separate subject and background prompts.
+
+        Both halves run concurrently when the backend accepts parallel
+        requests (num_parallel > 1) unless parallel is False.
+        """
+        await self._ensure_models()
+        model = model_override or self.vision_model
+
+        # Encode once and share between both payloads
+        subject_payload, background_payload = self._build_breakdown_payloads(
+            user_input, await self.encode_image_async(image_path), prompt_type, model, word_limit, target_model
+        )
+
+        if parallel is None:
+            parallel = self.num_parallel > 1
+
+        if parallel:
+            (subject_result, subject_ok), (background_result, background_ok) = await asyncio.gather(
+                self._run_breakdown_part(subject_payload),
+                self._run_breakdown_part(background_payload)
+            )
+        else:
+            subject_result, subject_ok = await self._run_breakdown_part(subject_payload)
+            background_result, background_ok = await self._run_breakdown_part(background_payload)
+
+        return self._combine_breakdown(subject_result, subject_ok, background_result, background_ok)
+
+    async def _run_breakdown_part(self, payload: dict) -> tuple:
+        """Run one half of a breakdown, returning (text, succeeded)"""
+        try:
+            return (await self._post_generate(payload))['response'], True
+        except Exception as e:
+            return self._format_error(e), False
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk prompt generation
+`batch` reads one request per JSONL line, generates them concurrently in one
+process and writes each result as a JSONL line as soon as it completes.
+`breakdown` runs every image in a directory through the breakdown pipeline.
+A checkpoint file records finished items so an interrupted run can resume.
+
+Usage:
+    python prompt_generator.py batch requests.jsonl -o results.jsonl -c 8 --checkpoint run.ckpt
+    cat requests.jsonl | python prompt_generator.py batch - > results.jsonl
+    python prompt_generator.py breakdown refs/ -r -o breakdowns.jsonl --checkpoint refs.ckpt
+
+Each input line is a JSON object such as
+    {"prompt": "a castle at dusk", "type": "image", "target_model": "flux",
+     "word_limit": 60, "image": "refs/castle.jpg", "id": "castle-1"}
+where only "prompt" is required ("model" overrides the Ollama model), or
+a bare JSON string holding just the prompt.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Iterator, Optional, TextIO
+
+# Files the breakdown command picks up (matches the Web UI's uploads)
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
+
+# Record fields and the generate_prompt arguments they map to
+FIELDS = {
+    'prompt': 'user_input',
+    'type': 'prompt_type',
+    'target_model': 'target_model',
+    'word_limit': 'word_limit',
+    'image': 'image_path',
+    'model': 'model_override',
+}
+
+
+def line_key(line: str) -> str:
+    """Identify an input line's content, so a changed input is not mistaken for a finished one"""
+    return hashlib.sha1(line.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def parse_record(line: str, base_dir: str) -> dict:
+    """Turn one JSONL line into generate_prompt keyword arguments; raises ValueError if invalid"""
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if isinstance(record, str):
+        record = {'prompt': record}
+    if not isinstance(record, dict):
+        raise ValueError("Expected a JSON object or string")
+    if not str(record.get('prompt') or '').strip():
+        raise ValueError("'prompt' is required")
+    if record.get('type', 'image') not in ("image", "video"):
+        raise ValueError(f"Unknown type: {record['type']}")
+
+    request = {argument: record[field] for field, argument in FIELDS.items() if record.get(field) is not None}
+    if 'word_limit' in request:
+        request['word_limit'] = int(request['word_limit'])
+    if 'image_path' in request:
+        # Relative image paths are relative to the input file
+        request['image_path'] = os.path.join(base_dir, os.path.expanduser(request['image_path']))
+    return request
+
+
+class Checkpoint:
+    """Append-only record of finished items, one tab-separated tuple per line.
+
+    batch records (input line index, line key): a line counts as finished
+    only if both its position and its content match, so editing the input
+    reruns the edited lines. breakdown records (image path, modification
+    time, content hash), so a replaced image is analysed again.
+    Results are written before they are checkpointed: a crash in between
+    repeats that one item rather than losing it.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done = set()
+        self._file = None
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for entry in f:
+                    if entry.endswith("\n"):  # A torn last line was never committed
+                        self.done.add(tuple(entry.rstrip("\n").split("\t")))
+
+    def __contains__(self, item: tuple) -> bool:
+        return tuple(str(part) for part in item) in self.done
+
+    def add(self, *parts):
+        if self.path is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("\t".join(str(part) for part in parts) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def run_batch(generator,
+              source: TextIO,
+              output: TextIO,
+              checkpoint: Checkpoint,
+              base_dir: str = ".",
+              concurrency: Optional[int] = None,
+              use_cache: bool = True,
+              progress: bool = True) -> dict:
+    """Generate every unfinished line of source, writing JSONL results to output as they complete.
+
+    Returns counts of 'ok', 'failed' and 'skipped' lines. Failed lines
+    are written with their error but not checkpointed, so a resumed run
+    retries them.
+    """
+    counts = {'ok': 0, 'failed': 0, 'skipped': 0}
+    positions = []  # iter_generate_many index -> (input index, record, line key)
+
+    def write(index: int, record, result: Optional[str], error: Optional[str]):
+        line = {'index': index}
+        if isinstance(record, dict) and 'id' in record:
+            line['id'] = record['id']
+        line.update({'request': record, 'result': result, 'error': error})
+        output.write(json.dumps(line, ensure_ascii=False) + "\n")
+        output.flush()
+        counts['failed' if error else 'ok'] += 1
+
+    def requests() -> Iterator[dict]:
+        for index, line in enumerate(source):
+            if not line.strip():
+                continue
+            key = line_key(line)
+            if (index, key) in checkpoint:
+                counts['skipped'] += 1
+                continue
+            try:
+                request = parse_record(line, base_dir)
+            except ValueError as e:
+                write(index, line.strip(), None, str(e))
+                continue
+            request['use_cache'] = use_cache
+            positions.append((index, json.loads(line), key))
+            yield request
+
+    for item in generator.iter_generate_many(requests(), concurrency=concurrency):
+        index, record, key = positions[item['index']]
+        write(index, record, item['result'], item['error'])
+        if item['error'] is None:
+            checkpoint.add(index, key)
+        if progress:
+            print(f"\r✓ {counts['ok']} done, {counts['failed']} failed, {counts['skipped']} skipped",
+                  end="", file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+    return counts
+
+
+def batch_mode(args):
+    """Entry point for `prompt_generator.py batch ...`"""
+    from prompt_generator import PromptGenerator
+
+    parser = argparse.ArgumentParser(prog="prompt_generator.py batch",
+                                     description="Generate prompts for every line of a JSONL file")
+    parser.add_argument("input", help="JSONL requests file, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=None,
+                        help="Generations in flight at once (default: OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--checkpoint",
+                        help="File recording finished lines; rerun with the same file to resume")
+    parser.add_argument("--host", default=None,
+                        help="Ollama host (default: env OLLAMA_HOST or http://localhost:11434)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Ignore the response cache and sample new results")
+    parser.add_argument("-q", "--quiet", action="store_true", help="No progress on stderr")
+    parsed = parser.parse_args(args)
+
+    checkpoint = Checkpoint(parsed.checkpoint)
+    if checkpoint.done and not parsed.quiet:
+        print(f"↩️  Resuming: {len(checkpoint.done)} lines already done", file=sys.stderr)
+
+    generator = PromptGenerator(ollama_host=parsed.host, history_source="batch")
+    if not generator.check_ollama_connection():
+        print("❌ Cannot connect to Ollama at", generator.ollama_host, file=sys.stderr)
+        sys.exit(1)
+
+    if parsed.input == "-":
+        source, base_dir = sys.stdin, os.getcwd()
+    else:
+        source, base_dir = open(parsed.input, encoding="utf-8"), os.path.dirname(os.path.abspath(parsed.input))
+    # A resumed run adds to the results it already wrote
+    output = open(parsed.output, "a" if checkpoint.done else "w", encoding="utf-8") if parsed.output else sys.stdout
+
+    started = time.monotonic()
+    try:
+        counts = run_batch(generator, source, output, checkpoint, base_dir,
+                           concurrency=parsed.concurrency, use_cache=not parsed.fresh,
+                           progress=not parsed.quiet)
+    except KeyboardInterrupt:
+        print("\n⏹️  Interrupted" + (f"; rerun with --checkpoint {parsed.checkpoint} to resume"
+                                     if parsed.checkpoint else ""), file=sys.stderr)
+        sys.exit(130)
+    finally:
+        checkpoint.close()
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        generator.close()
+
+    if not parsed.quiet:
+        print(f"Finished in {time.monotonic() - started:.1f}s: {counts['ok']} ok, {counts['failed']} failed, "
+              f"{counts['skipped']} skipped", file=sys.stderr)
+    if counts['failed']:
+        sys.exit(2)
+
+
+def find_images(directory: str, recursive: bool = False) -> Iterator[str]:
+    """Image files under directory, in sorted order"""
+    if recursive:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield os.path.join(root, name)
+    else:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS and os.path.isfile(path):
+                yield path
+
+
+def breakdown_mode(args):
+    """Entry point for `prompt_generator.py breakdown ...`"""
+    from prompt_generator import PromptGenerator
+
+    parser = argparse.ArgumentParser(prog="prompt_generator.py breakdown",
+                                     description="Break down every image in a directory into subject and "
+                                                 "background prompts")
+    parser.add_argument("directory", help="Directory of reference images")
+    parser.add_argument("prompt", nargs="?", default="", help="Instructions applied to every image")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Include subdirectories")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("-t", "--type", choices=["image", "video"], default="image",
+                        help="Prompt type (default: image)")
+    parser.add_argument("--target-model", default="stable-diffusion", help="Target model (default: stable-diffusion)")
+    parser.add_argument("-w", "--word-limit", type=int, default=50)
+    parser.add_argument("-m", "--model", help="Override the vision model")
+    parser.add_argument("-c", "--concurrency", type=int, default=None,
+                        help="Vision requests in flight at once (default: OLLAMA_NUM_PARALLEL per server)")
+    parser.add_argument("--prepare-workers", type=int, default=None,
+                        help="Threads reading and preprocessing images (default: CPU count)")
+    parser.add_argument("--checkpoint",
+                        help="File recording finished images; rerun with the same file to resume")
+    parser.add_argument("--host", default=None,
+                        help="Ollama host (default: env OLLAMA_HOST or http://localhost:11434)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Ignore the response cache and sample new results")
+    parser.add_argument("-q", "--quiet", action="store_true", help="No progress on stderr")
+    parsed = parser.parse_args(args)
+
+    if not os.path.isdir(parsed.directory):
+        parser.error(f"Not a directory: {parsed.directory}")
+
+    checkpoint = Checkpoint(parsed.checkpoint)
+    generator = PromptGenerator(ollama_host=parsed.host, history_source="batch")
+    if not generator.check_ollama_connection():
+        print("❌ Cannot connect to Ollama at", generator.ollama_host, file=sys.stderr)
+        sys.exit(1)
+
+    # Finished images are skipped by path and modification time before they are read;
+    # the checkpoint also holds the content hash for reference
+    done_paths = {entry[0]: entry[1] for entry in checkpoint.done if len(entry) == 3}
+    counts = {'ok': 0, 'failed': 0, 'skipped': 0, 'duplicates': 0}
+
+    def pending_images() -> Iterator[str]:
+        for path in find_images(parsed.directory, parsed.recursive):
+            if done_paths.get(path) == str(int(os.path.getmtime(path))):
+                counts['skipped'] += 1
+                continue
+            yield path
+
+    output = open(parsed.output, "a" if checkpoint.done else "w", encoding="utf-8") if parsed.output else sys.stdout
+    started = time.monotonic()
+    results = generator.iter_breakdown_images(
+        pending_images(),
+        user_input=parsed.prompt,
+        prompt_type=parsed.type,
+        model_override=parsed.model,
+        word_limit=parsed.word_limit,
+        target_model=parsed.target_model,
+        concurrency=parsed.concurrency,
+        prepare_workers=parsed.prepare_workers,
+        use_cache=not parsed.fresh
+    )
+    try:
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            if result['error']:
+                counts['failed'] += 1
+            else:
+                counts['ok'] += 1
+                counts['duplicates'] += result['duplicate_of'] is not None
+                path = result['image']
+                checkpoint.add(path, str(int(os.path.getmtime(path))), result['sha256'])
+            if not parsed.quiet:
+                print(f"\r✓ {counts['ok']} done ({counts['duplicates']} duplicates), {counts['failed']} failed, "
+                      f"{counts['skipped']} skipped", end="", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        print("\n⏹️  Interrupted" + (f"; rerun with --checkpoint {parsed.checkpoint} to resume"
+                                     if parsed.checkpoint else ""), file=sys.stderr)
+        sys.exit(130)
+    finally:
+        results.close()
+        checkpoint.close()
+        if output is not sys.stdout:
+            output.close()
+        generator.close()
+
+    if not parsed.quiet:
+        print(f"\nFinished in {time.monotonic() - started:.1f}s: {counts['ok']} ok, {counts['failed']} failed, "
+              f"{counts['skipped']} skipped", file=sys.stderr)
+    if counts['failed']:
+        sys.exit(2)
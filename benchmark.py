@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the prompt generator and Web UI
+Measures throughput and latency percentiles at several concurrency levels
+against the bundled mock Ollama server (or a real one with --host)
+
+Usage:
+    python benchmark.py                                   # all scenarios, mock server
+    python benchmark.py -s generate,web -c 1,8,32 -n 200  # pick scenarios and load
+    python benchmark.py -o new.json --compare old.json    # save and compare runs
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+SCENARIOS = ("generate", "stream", "breakdown", "batch", "web", "web-stream")
+
+# Reported latency percentiles
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarize(seconds: list) -> Optional[dict]:
+    """Latency summary in milliseconds"""
+    if not seconds:
+        return None
+    values = sorted(seconds)
+    summary = {f"p{pct}": round(percentile(values, pct) * 1000, 2) for pct in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values) * 1000, 2)
+    summary["max"] = round(values[-1] * 1000, 2)
+    return summary
+
+
+def run_load(call: Callable[[int], tuple], requests: int, concurrency: int) -> dict:
+    """Run call(i) for i in range(requests) on concurrency threads.
+
+    call returns (ok, seconds to first token or None).
+    """
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            ok, first_token = call(i)
+        except Exception:
+            ok, first_token = False, None
+        return time.perf_counter() - start, ok, first_token
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, range(requests)))
+    duration = time.perf_counter() - start
+
+    latencies = [latency for latency, ok, _ in outcomes if ok]
+    first_tokens = [first for _, ok, first in outcomes if ok and first is not None]
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, ok, _ in outcomes if not ok),
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(requests / duration, 2) if duration else 0.0,
+        'latency_ms': summarize(latencies),
+        'first_token_ms': summarize(first_tokens)
+    }
+
+
+def sample_image() -> bytes:
+    """A reference photo-sized image, so preprocessing is part of the measurement"""
+    try:
+        from PIL import Image
+    except ImportError:
+        # 1x1 PNG; the generator sends it as-is without Pillow
+        return bytes.fromhex(
+            "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+            "1f15c4890000000d49444154789c6360000002000154a24f5d00000000"
+            "49454e44ae426082")
+    image = Image.new("RGB", (2048, 1536))
+    for x in range(0, 2048, 64):
+        image.paste((x % 256, 128, 255 - x % 256), (x, 0, x + 64, 1536))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+class Bench:
+    """Scenario runners sharing one generator and (for web scenarios) one HTTP server"""
+
+    def __init__(self, ollama_host: str, repeat: bool):
+        from prompt_generator import PromptGenerator
+
+        self.ollama_host = ollama_host
+        self.repeat = repeat
+        self.run_id = uuid.uuid4().hex[:8]
+        self.generator = PromptGenerator(ollama_host=ollama_host)
+        self.image = sample_image()
+        self._web_url = None
+        self._web_server = None
+        self._local = threading.local()
+
+    def prompt(self, i: int) -> str:
+        # Unique prompts unless --repeat, so caching and coalescing do not skew results
+        return "benchmark prompt" if self.repeat else f"benchmark prompt {self.run_id} {i}"
+
+    def close(self):
+        if self._web_server is not None:
+            self._web_server.shutdown()
+        self.generator.close()
+
+    def run(self, scenario: str, requests: int, concurrency: int) -> dict:
+        if scenario == "batch":
+            return self.batch(requests, concurrency)
+        if scenario.startswith("web"):
+            self._web()
+        call = {
+            'generate': self.generate,
+            'stream': self.stream,
+            'breakdown': self.breakdown,
+            'web': self.web,
+            'web-stream': self.web_stream
+        }[scenario]
+        return run_load(call, requests, concurrency)
+
+    def generate(self, i: int) -> tuple:
+        result = self.generator.generate_prompt(self.prompt(i))
+        return not result.startswith("Error"), None
+
+    def stream(self, i: int) -> tuple:
+        start = time.perf_counter()
+        first_token = None
+        for _ in self.generator.generate_prompt_stream(self.prompt(i)):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+        return True, first_token
+
+    def breakdown(self, i: int) -> tuple:
+        result = self.generator.breakdown_image_prompt(self.prompt(i), self.image)
+        return not result['partial'] and not result['combined'].startswith("Error"), None
+
+    def batch(self, requests: int, concurrency: int) -> dict:
+        start = time.perf_counter()
+        completed = []
+        errors = 0
+        for item in self.generator.iter_generate_many([self.prompt(i) for i in range(requests)],
+                                                      concurrency=concurrency):
+            completed.append(time.perf_counter() - start)
+            errors += item['error'] is not None
+        duration = time.perf_counter() - start
+        return {
+            'requests': requests,
+            'errors': errors,
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(requests / duration, 2) if duration else 0.0,
+            # Time from batch start until each item completed
+            'latency_ms': summarize(completed),
+            'first_token_ms': None
+        }
+
+    def web(self, i: int) -> tuple:
+        response = self._session().post(f"{self._web()}/api/generate", data={'prompt': self.prompt(i)})
+        return response.status_code == 200 and not response.json()['result'].startswith("Error"), None
+
+    def web_stream(self, i: int) -> tuple:
+        start = time.perf_counter()
+        first_token = None
+        ok = False
+        with self._session().post(f"{self._web()}/api/generate/stream",
+                                  data={'prompt': self.prompt(i)}, stream=True) as response:
+            for line in response.iter_lines():
+                if line.startswith(b"event: done"):
+                    ok = True
+                elif line.startswith(b"data:") and first_token is None:
+                    first_token = time.perf_counter() - start
+        return ok and response.status_code == 200, first_token
+
+    def _session(self):
+        # One keep-alive session per client thread, like separate browsers
+        import requests
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _web(self) -> str:
+        """Start the Web UI on a threaded local server the first time it is needed"""
+        if self._web_url is None:
+            os.environ["OLLAMA_HOST"] = self.ollama_host
+            from werkzeug.serving import WSGIRequestHandler, make_server
+            import web_ui
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            self._web_server = make_server("127.0.0.1", 0, web_ui.app, threaded=True,
+                                           request_handler=QuietHandler)
+            threading.Thread(target=self._web_server.serve_forever, daemon=True).start()
+            self._web_url = f"http://127.0.0.1:{self._web_server.server_port}"
+        return self._web_url
+
+
+def environment() -> dict:
+    """Metadata that identifies a run when comparing results"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform()
+    }
+
+
+def print_results(results: list, baseline: Optional[dict] = None):
+    previous = {}
+    if baseline:
+        previous = {(r['scenario'], r['concurrency']): r for r in baseline['results']}
+
+    print(f"\n{'scenario':<12} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    print("-" * 66)
+    for r in results:
+        latency = r['latency_ms'] or {}
+        line = (f"{r['scenario']:<12} {r['concurrency']:>5} {r['throughput_rps']:>9.1f} "
+                f"{latency.get('p50', 0):>9.1f} {latency.get('p95', 0):>9.1f} "
+                f"{latency.get('p99', 0):>9.1f} {r['errors']:>7}")
+        old = previous.get((r['scenario'], r['concurrency']))
+        if old and old['throughput_rps']:
+            change = (r['throughput_rps'] - old['throughput_rps']) / old['throughput_rps'] * 100
+            line += f"   {change:+.1f}% req/s"
+            if old['latency_ms'] and latency:
+                change = (latency['p95'] - old['latency_ms']['p95']) / old['latency_ms']['p95'] * 100
+                line += f", {change:+.1f}% p95"
+        print(line)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prompt generator and Web UI")
+    parser.add_argument("-s", "--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated scenarios (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("-c", "--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels (default: 1,4,16)")
+    parser.add_argument("-n", "--requests", type=int, default=64, help="Requests per scenario and level")
+    parser.add_argument("--host", help="Benchmark a real Ollama server instead of the mock")
+    parser.add_argument("--repeat", action="store_true",
+                        help="Send the same prompt every time (measures caching and coalescing)")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Show changes against a previous JSON result file")
+
+    mock = parser.add_argument_group("mock server")
+    mock.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    mock.add_argument("--tokens-per-sec", type=float, default=200.0)
+    mock.add_argument("--max-tokens", type=int, default=40)
+    mock.add_argument("--num-parallel", type=int, default=4, help="Requests the mock runs at once")
+    mock.add_argument("--failure-rate", type=float, default=0.0)
+
+    parsed = parser.parse_args(args)
+    scenarios = [s.strip() for s in parsed.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in parsed.concurrency.split(",")]
+
+    # Measure the generator itself: no response cache, and enough pooled
+    # connections for the highest concurrency level
+    os.environ.pop("PROMPT_CACHE_PATH", None)
+    os.environ["OLLAMA_POOL_SIZE"] = str(max(levels + [10]))
+    os.environ["OLLAMA_WARM_UP"] = "0"
+
+    server = None
+    settings = {'requests': parsed.requests, 'repeat': parsed.repeat}
+    if parsed.host:
+        ollama_host = parsed.host
+        settings['ollama_host'] = ollama_host
+    else:
+        from mock_ollama import MockOllama
+        server = MockOllama(latency=parsed.latency, tokens_per_sec=parsed.tokens_per_sec,
+                            max_tokens=parsed.max_tokens, num_parallel=parsed.num_parallel,
+                            failure_rate=parsed.failure_rate, seed=0).start()
+        ollama_host = server.url
+        settings['mock'] = {
+            'latency': parsed.latency,
+            'tokens_per_sec': parsed.tokens_per_sec,
+            'max_tokens': parsed.max_tokens,
+            'num_parallel': parsed.num_parallel,
+            'failure_rate': parsed.failure_rate
+        }
+
+    bench = Bench(ollama_host, parsed.repeat)
+    results = []
+    try:
+        for scenario in scenarios:
+            for level in levels:
+                print(f"⏱️  {scenario} x{parsed.requests} at concurrency {level}...", flush=True)
+                result = bench.run(scenario, parsed.requests, level)
+                results.append({'scenario': scenario, 'concurrency': level, **result})
+    finally:
+        bench.close()
+        if server is not None:
+            server.stop()
+
+    report = {'environment': environment(), 'settings': settings, 'results': results}
+
+    baseline = None
+    if parsed.compare:
+        with open(parsed.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if parsed.output:
+        with open(parsed.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {parsed.output}")
+
+
+if __name__ == "__main__":
+    main()
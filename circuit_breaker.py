@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker for Ollama requests
+Stops sending generations to an Ollama that keeps failing or timing out,
+so callers get an immediate answer instead of waiting on hung requests
+"""
+
+import os
+import threading
+import time
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    While closed every call is allowed; failure_threshold failures in a
+    row open the circuit. While open, allow() refuses calls until
+    reset_timeout seconds have passed, then the circuit goes half-open
+    and lets up to half_open_max trial calls through: a success closes
+    it, a failure opens it again. Trials that never report back are
+    replaced after another reset_timeout. A failure_threshold of 0
+    disables the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = max(1, half_open_max)
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0  # Consecutive
+        self.trips = 0
+        self.last_error = None
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trials_started = 0.0
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """Build a breaker from OLLAMA_BREAKER_* environment variables"""
+        return cls(
+            failure_threshold=int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("OLLAMA_BREAKER_RESET", "30")),
+            half_open_max=int(os.getenv("OLLAMA_BREAKER_TRIALS", "1"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now (taking a trial slot when half-open)"""
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._trials = 0
+            if self._trials >= self.half_open_max and now - self._trials_started < self.reset_timeout:
+                return False
+            if self._trials == 0 or self._trials >= self.half_open_max:
+                self._trials = 0
+                self._trials_started = now
+            self._trials += 1
+            return True
+
+    def available(self) -> bool:
+        """Whether allow() would let a call through, without taking a trial slot"""
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                return now - self._opened_at >= self.reset_timeout
+            if self.state == HALF_OPEN:
+                return self._trials < self.half_open_max or now - self._trials_started >= self.reset_timeout
+            return True
+
+    def success(self):
+        """Record a call that reached a working Ollama"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                print("✓ Ollama circuit closed")
+            if self.state != OPEN:
+                self.state = CLOSED
+                self.failures = 0
+                self.last_error = None
+
+    def failure(self, error: Exception):
+        """Record a call that failed or timed out"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.last_error = str(error)
+            if self.state == OPEN:
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                print(f"⚠️  Ollama circuit open after {self.failures} consecutive failures: {error}")
+
+    def reset(self):
+        """Close the circuit and forget past failures (e.g. after switching servers)"""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.last_error = None
+            self._trials = 0
+
+    def retry_after(self) -> float:
+        """Seconds until the open circuit lets a trial call through (0 when not open)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def status(self) -> dict:
+        retry_after = self.retry_after()
+        with self._lock:
+            return {
+                'state': self.state if self.enabled else "disabled",
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'retry_after': round(retry_after, 1),
+                'trips': self.trips,
+                'last_error': self.last_error
+            }
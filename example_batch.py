@@ -28,11 +28,11 @@ def main():
         "futuristic space station interior"
     ]
 
-    for request in requests:
-        print(f"\nRequest: {request}")
+    # Requests run concurrently; results come back in input order
+    for item in generator.generate_many(requests):
+        print(f"\nRequest: {item['request']['user_input']}")
         print("-" * 40)
-        result = generator.generate_prompt(request, prompt_type="image")
-        print(result)
+        print(item['error'] or item['result'])
         print()
 
     # Example 2: Video prompts
@@ -45,11 +45,17 @@ def main():
         "time lapse of city at night"
     ]
 
-    for request in video_requests:
-        print(f"\nRequest: {request}")
+    video_items = [{'user_input': request, 'prompt_type': 'video'} for request in video_requests]
+
+    # Print each result as soon as it is ready, with progress
+    for item in generator.iter_generate_many(
+        video_items,
+        concurrency=2,
+        progress=lambda done, total: print(f"[{done}/{total}]")
+    ):
+        print(f"\nRequest: {item['request']['user_input']}")
         print("-" * 40)
-        result = generator.generate_prompt(request, prompt_type="video")
-        print(result)
+        print(item['error'] or item['result'])
         print()
 
     # Example 3: With reference image (if you have one)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn configuration for serving the Web UI in production
+
+Usage: gunicorn -c gunicorn.conf.py web_ui:app
+Every setting can be overridden with the environment variables below.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# Worker processes x threads per worker = concurrent requests.
+# Each generation holds a thread until Ollama answers, so size threads
+# for the number of in-flight generations rather than for CPU.
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "16"))
+worker_class = "gthread"
+
+# Seconds a worker may be unresponsive before it is restarted, and
+# seconds in-flight requests get to finish on shutdown/reload
+timeout = int(os.getenv("WEB_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "130"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+# Recycle workers periodically to bound memory growth (0 disables)
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# Import the app once in the master; each worker then builds its own
+# generator in post_fork so no HTTP connections are shared across processes
+preload_app = True
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    import web_ui
+    web_ui.reset_generator()
+    web_ui.start_model_warmers()
+
+
+def worker_exit(server, worker):
+    import web_ui
+    web_ui.jobs.shutdown()
+    web_ui.generator.close()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generation history
+Every generated prompt with its inputs and timings, kept in SQLite with a
+full-text index so past results can be found instead of regenerated
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".promptgen", "history.db")
+
+COLUMNS = ("id", "created", "source", "mode", "prompt_type", "target_model", "model", "seed",
+           "input", "output", "timings", "extra")
+
+
+def match_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    terms = [term for term in text.split() if re.search(r"\w", term)]
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+class GenerationHistory:
+    """Persistent log of generation results with full-text search.
+
+    Records live in a SQLite file shared by every process using the same
+    path. Input and output are indexed with FTS5 (falling back to LIKE
+    scans where SQLite lacks it). Every compact_every records, entries
+    older than ttl seconds and all but the newest max_records are
+    deleted and the index is compacted; a ttl or max_records of 0
+    disables that limit.
+    """
+
+    def __init__(self,
+                 path: str = DEFAULT_PATH,
+                 ttl: float = 90 * 24 * 3600,
+                 max_records: int = 100000,
+                 compact_every: int = 500):
+        self.path = path
+        self.ttl = ttl
+        self.max_records = max_records
+        self.compact_every = compact_every
+        self.fts = True
+        self._added = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            # Must precede the first table to take effect; lets compact() give space back
+            db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created REAL NOT NULL,
+                source TEXT,
+                mode TEXT,
+                prompt_type TEXT,
+                target_model TEXT,
+                model TEXT,
+                seed TEXT,
+                input TEXT NOT NULL,
+                output TEXT NOT NULL,
+                timings TEXT,
+                extra TEXT
+            )""")
+            db.execute("CREATE INDEX IF NOT EXISTS history_created ON history (created)")
+            try:
+                db.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS history_fts
+                    USING fts5(input, output, content='history', content_rowid='id')""")
+            except sqlite3.OperationalError:
+                self.fts = False
+            else:
+                db.execute("""CREATE TRIGGER IF NOT EXISTS history_insert AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, input, output) VALUES (new.id, new.input, new.output);
+                END""")
+                db.execute("""CREATE TRIGGER IF NOT EXISTS history_delete AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, input, output)
+                    VALUES ('delete', old.id, old.input, old.output);
+                END""")
+
+    @classmethod
+    def from_env(cls) -> Optional["GenerationHistory"]:
+        """Build a history from PROMPT_HISTORY_* environment variables, or None if disabled or unusable"""
+        path = os.getenv("PROMPT_HISTORY_PATH", DEFAULT_PATH)
+        if not path:
+            return None
+        try:
+            return cls(
+                path=path,
+                ttl=float(os.getenv("PROMPT_HISTORY_TTL", str(90 * 24 * 3600))),
+                max_records=int(os.getenv("PROMPT_HISTORY_MAX", "100000")),
+                compact_every=int(os.getenv("PROMPT_HISTORY_COMPACT_EVERY", "500"))
+            )
+        except (OSError, sqlite3.Error) as e:
+            # Generation must not depend on the history being writable
+            print(f"Warning: History is disabled, could not open {path}: {e}")
+            return None
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation keeps this safe across threads and forks
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self,
+            input: str,
+            output: str,
+            source: Optional[str] = None,
+            mode: Optional[str] = None,
+            prompt_type: Optional[str] = None,
+            target_model: Optional[str] = None,
+            model: Optional[str] = None,
+            seed: Optional[str] = None,
+            timings: Optional[dict] = None,
+            extra: Optional[dict] = None) -> int:
+        """Record one result and return its id"""
+        with self._connect() as db:
+            cursor = db.execute(
+                """INSERT INTO history (created, source, mode, prompt_type, target_model, model, seed,
+                                        input, output, timings, extra)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (time.time(), source, mode, prompt_type, target_model, model,
+                 str(seed) if seed is not None else None, input, output,
+                 json.dumps(timings) if timings else None, json.dumps(extra) if extra else None)
+            )
+            record_id = cursor.lastrowid
+
+        self._added += 1
+        if self.compact_every and self._added % self.compact_every == 0:
+            self.compact()
+        return record_id
+
+    def search(self,
+               query: str = "",
+               limit: int = 20,
+               before: Optional[int] = None,
+               **filters) -> dict:
+        """Return the newest records matching query, a page at a time.
+
+        query matches words (or word prefixes) anywhere in the input or
+        output; filters narrow by exact source, mode, prompt_type,
+        target_model, model or seed. Pass the returned 'next' as before
+        to get the following page; it is None on the last page.
+        """
+        unknown = set(filters) - {"source", "mode", "prompt_type", "target_model", "model", "seed"}
+        if unknown:
+            raise TypeError(f"Unexpected filters: {', '.join(sorted(unknown))}")
+
+        clauses, params = [], []
+        match = match_query(query) if query else ""
+        if match and self.fts:
+            clauses.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+            params.append(match)
+        elif query:
+            for term in query.split():
+                clauses.append("(input LIKE ? ESCAPE '\\' OR output LIKE ? ESCAPE '\\')")
+                pattern = "%" + re.sub(r"([%_\\])", r"\\\1", term) + "%"
+                params.extend((pattern, pattern))
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(int(before))
+        for column, value in sorted(filters.items()):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(str(value))
+
+        limit = max(1, min(int(limit), 500))
+        sql = f"SELECT {', '.join(COLUMNS)} FROM history"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC LIMIT ?"
+        with self._connect() as db:
+            rows = db.execute(sql, params + [limit + 1]).fetchall()
+
+        items = [self._to_dict(row) for row in rows[:limit]]
+        return {'items': items, 'next': items[-1]['id'] if len(rows) > limit else None}
+
+    def get(self, record_id: int) -> Optional[dict]:
+        """Return one record, or None"""
+        with self._connect() as db:
+            row = db.execute(f"SELECT {', '.join(COLUMNS)} FROM history WHERE id = ?",
+                             (int(record_id),)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def delete(self, record_id: int) -> bool:
+        """Delete one record; returns whether it existed"""
+        with self._connect() as db:
+            return db.execute("DELETE FROM history WHERE id = ?", (int(record_id),)).rowcount > 0
+
+    def count(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def compact(self, vacuum: bool = False) -> int:
+        """Apply the retention limits, merge the index and free unused pages.
+
+        Returns the number of records deleted. vacuum=True also rewrites
+        the whole file, which is slow on large histories.
+        """
+        with self._connect() as db:
+            deleted = 0
+            if self.ttl:
+                deleted += db.execute("DELETE FROM history WHERE created < ?",
+                                      (time.time() - self.ttl,)).rowcount
+            if self.max_records:
+                deleted += db.execute(
+                    "DELETE FROM history WHERE id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (self.max_records,)
+                ).rowcount
+            if self.fts:
+                db.execute("INSERT INTO history_fts (history_fts) VALUES ('optimize')")
+        with self._connect() as db:
+            db.execute("PRAGMA incremental_vacuum")
+        if vacuum:
+            db = sqlite3.connect(self.path, timeout=30)
+            try:
+                db.execute("VACUUM")
+            finally:
+                db.close()
+        return deleted
+
+    def _to_dict(self, row: sqlite3.Row) -> dict:
+        record = dict(row)
+        record['timings'] = json.loads(record['timings']) if record['timings'] else {}
+        record['extra'] = json.loads(record['extra']) if record['extra'] else {}
+        return record
+
+
+def history_mode(args):
+    """`prompt_generator.py history [query]`: search the generation history"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="prompt_generator.py history",
+                                     description="Search previously generated prompts")
+    parser.add_argument("query", nargs="*", help="Words to look for in the request or the prompt")
+    parser.add_argument("-n", "--limit", type=int, default=10, help="Results to show (default: 10)")
+    parser.add_argument("--before", type=int, help="Only show records older than this id (next page)")
+    parser.add_argument("--target-model", help="Only show prompts for this target model")
+    parser.add_argument("-t", "--type", dest="prompt_type", choices=["image", "video"],
+                        help="Only show image or video prompts")
+    parser.add_argument("--json", action="store_true", help="Print records as JSON lines")
+    parser.add_argument("--compact", action="store_true",
+                        help="Apply PROMPT_HISTORY_TTL/MAX now and vacuum the database")
+    parsed = parser.parse_args(args)
+
+    history = GenerationHistory.from_env()
+    if history is None:
+        print("❌ History is disabled (PROMPT_HISTORY_PATH is empty or cannot be opened)")
+        return
+
+    if parsed.compact:
+        deleted = history.compact(vacuum=True)
+        print(f"✓ Compacted {history.path}: {deleted} records removed, {history.count()} kept")
+        return
+
+    page = history.search(" ".join(parsed.query), limit=parsed.limit, before=parsed.before,
+                          target_model=parsed.target_model, prompt_type=parsed.prompt_type)
+    for record in page['items']:
+        if parsed.json:
+            print(json.dumps(record, ensure_ascii=False))
+            continue
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(record['created']))
+        print(f"#{record['id']}  {created}  {record['prompt_type']}/{record['target_model']}  "
+              f"{record['model']}  ({record['source']})")
+        print(f"  > {record['input']}")
+        print(f"  {record['output']}\n")
+    if not parsed.json:
+        if not page['items']:
+            print("No matching prompts")
+        elif page['next'] is not None:
+            print(f"More: --before {page['next']}")
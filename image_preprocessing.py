@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image preprocessing for vision requests
+Downscales, re-encodes and strips metadata before images are sent to Ollama
+"""
+
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+    ImageOps = None
+
+FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP"}
+
+_warned_missing_pillow = False
+
+
+class ImagePreprocessor:
+    """Shrink images to what vision models actually use.
+
+    Images larger than max_dimension are resized (keeping aspect ratio),
+    EXIF orientation is applied and all metadata dropped, animated images
+    are flattened to their first frame, and the result is re-encoded as
+    JPEG or WebP at the given quality. Encoded results are cached by the
+    content hash of the original bytes. Without Pillow, or when disabled,
+    images pass through unchanged.
+    """
+
+    def __init__(self,
+                 max_dimension: int = 1024,
+                 image_format: str = "jpeg",
+                 quality: int = 85,
+                 enabled: bool = True,
+                 cache_items: int = 64):
+        if image_format.lower() not in FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+
+        self.max_dimension = max_dimension
+        self.image_format = FORMATS[image_format.lower()]
+        self.quality = quality
+        self.enabled = enabled and Image is not None
+        self.cache_items = cache_items
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+        global _warned_missing_pillow
+        if enabled and Image is None and not _warned_missing_pillow:
+            _warned_missing_pillow = True
+            print("Warning: Pillow is not installed, images are sent without preprocessing")
+
+    @classmethod
+    def from_env(cls) -> "ImagePreprocessor":
+        """Build a preprocessor from PROMPT_IMAGE_* environment variables"""
+        return cls(
+            max_dimension=int(os.getenv("PROMPT_IMAGE_MAX_SIZE", "1024")),
+            image_format=os.getenv("PROMPT_IMAGE_FORMAT", "jpeg"),
+            quality=int(os.getenv("PROMPT_IMAGE_QUALITY", "85")),
+            enabled=os.getenv("PROMPT_IMAGE_PREPROCESS", "1") != "0"
+        )
+
+    def encode(self, data: bytes) -> str:
+        """Preprocess image bytes and return them base64-encoded"""
+        if not self.enabled:
+            return base64.b64encode(data).decode('utf-8')
+
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        encoded = base64.b64encode(self.preprocess(data)).decode('utf-8')
+
+        with self._lock:
+            self._cache[key] = encoded
+            while len(self._cache) > self.cache_items:
+                self._cache.popitem(last=False)
+        return encoded
+
+    def preprocess(self, data: bytes) -> bytes:
+        """Return resized, metadata-free image bytes (or the input if it cannot be improved)"""
+        if not self.enabled:
+            return data
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.seek(0)  # First frame of animated GIF/WebP/PNG
+            has_metadata = bool(image.info.get("exif") or image.info.get("icc_profile")
+                                or image.info.get("xmp"))
+            animated = getattr(image, "is_animated", False)
+            image = ImageOps.exif_transpose(image)
+        except Exception as e:
+            print(f"Warning: Could not preprocess image, sending original: {e}")
+            return data
+
+        resized = max(image.size) > self.max_dimension
+        if resized:
+            image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+
+        image = self._flatten(image)
+
+        output = io.BytesIO()
+        image.save(output, format=self.image_format, quality=self.quality)
+        processed = output.getvalue()
+
+        # Keep the original when re-encoding gains nothing
+        if len(processed) >= len(data) and not (resized or has_metadata or animated):
+            return data
+        return processed
+
+    def _flatten(self, image):
+        """Convert to a mode the output format can store, compositing alpha onto white"""
+        if self.image_format == "WEBP" and image.mode in ("RGB", "RGBA"):
+            return image
+
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            if self.image_format == "WEBP":
+                return image
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            return background
+
+        return image.convert("RGB")
+
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background job queue for the Web UI
+Runs generations on a worker pool and records their status in SQLite so
+any WSGI worker process can answer status queries
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+
+class JobManager:
+    """Submit callables as jobs and track them by id.
+
+    Jobs run on a pool of `workers` threads in the submitting process.
+    Status and results live in a SQLite file, so processes sharing the
+    same path see each other's jobs. Finished jobs are purged after ttl
+    seconds. A job not finished timeout seconds after it was submitted
+    (0 for no limit) is marked failed and has its cancel event set; jobs
+    left queued or running by a killed process are failed once anyone
+    reads them after that deadline.
+    """
+
+    def __init__(self, path: Optional[str] = None, workers: int = 4, ttl: float = 3600, timeout: float = 600):
+        self.path = path or os.path.join(tempfile.gettempdir(), "promptgen-jobs.db")
+        self.workers = workers
+        self.ttl = ttl
+        self.timeout = timeout
+        self._executor = None
+        self._futures = {}
+
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                result TEXT,
+                error TEXT
+            )""")
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        """Build a manager from JOBS_* environment variables"""
+        return cls(
+            path=os.getenv("JOBS_DB_PATH"),
+            workers=int(os.getenv("JOBS_WORKERS", "4")),
+            ttl=float(os.getenv("JOBS_TTL", "3600")),
+            timeout=float(os.getenv("JOBS_TIMEOUT", "600"))
+        )
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation keeps this safe across threads and forks
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def submit(self, fn: Callable[[threading.Event], dict]) -> str:
+        """Queue fn(cancel) and return the new job id; fn returns a JSON-serialisable result.
+
+        cancel is a threading.Event set when the job times out; fn should
+        pass it on so the work it started is abandoned too.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            self._expire(db, now)
+            db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                       (DONE, FAILED, now - self.ttl))
+            db.execute("INSERT INTO jobs (id, status, created, updated) VALUES (?, ?, ?, ?)",
+                       (job_id, QUEUED, now, now))
+
+        # Created lazily so a preloaded app never forks with live threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._futures[job_id] = self._executor.submit(self._run, job_id, fn, now)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[[threading.Event], dict], created: float):
+        cancel = threading.Event()
+        timer = None
+        try:
+            if self.timeout and time.time() >= created + self.timeout:
+                # Waited in the queue past its deadline
+                self._update(job_id, FAILED, error=self._timeout_error())
+                return
+            if not self._update(job_id, RUNNING):
+                return  # Already failed by a reader
+            if self.timeout:
+                def expire():
+                    cancel.set()
+                    self._update(job_id, FAILED, error=self._timeout_error())
+
+                timer = threading.Timer(max(0.0, created + self.timeout - time.time()), expire)
+                timer.daemon = True
+                timer.start()
+            try:
+                result = fn(cancel)
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {str(e)}")
+                self._update(job_id, FAILED, error=str(e))
+            else:
+                self._update(job_id, DONE, result=result)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._futures.pop(job_id, None)
+
+    def _timeout_error(self) -> str:
+        return f"Timed out after {self.timeout:g} seconds"
+
+    def _update(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None) -> bool:
+        """Move an unfinished job to status; returns False if it had already finished"""
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, updated = ?, result = ?, error = ? WHERE id = ? AND status NOT IN (?, ?)",
+                (status, time.time(), json.dumps(result) if result is not None else None, error, job_id, DONE, FAILED)
+            )
+        return cursor.rowcount > 0
+
+    def _expire(self, db: sqlite3.Connection, now: float, job_id: Optional[str] = None):
+        """Fail jobs still queued or running past their deadline, whichever process they belong to"""
+        if not self.timeout:
+            return
+        query = "UPDATE jobs SET status = ?, updated = ?, error = ? WHERE status IN (?, ?) AND created < ?"
+        args = [FAILED, now, self._timeout_error(), QUEUED, RUNNING, now - self.timeout]
+        if job_id is not None:
+            query += " AND id = ?"
+            args.append(job_id)
+        db.execute(query, args)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Return {'id', 'status', 'created', 'updated', 'result', 'error'} or None"""
+        query = "SELECT id, status, created, updated, result, error FROM jobs WHERE id = ?"
+        with self._connect() as db:
+            row = db.execute(query, (job_id,)).fetchone()
+            if row is not None and row[1] not in FINISHED_STATES and self.timeout:
+                now = time.time()
+                if now - row[2] > self.timeout:
+                    # Its worker may have been killed, so nothing else would ever finish it
+                    self._expire(db, now, job_id)
+                    row = db.execute(query, (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'status': row[1],
+            'created': row[2],
+            'updated': row[3],
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5]
+        }
+
+    def watch(self, job_id: str, interval: float = 0.5, timeout: float = 600):
+        """Yield the job each time its status changes, until it finishes or timeout passes"""
+        deadline = time.monotonic() + timeout
+        last_status = None
+        while time.monotonic() < deadline:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield job
+                if last_status in FINISHED_STATES:
+                    return
+            time.sleep(interval)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the pool: queued jobs are marked failed, running ones finish if wait is True"""
+        if self._executor is None:
+            return
+
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        for job_id, future in list(self._futures.items()):
+            if future.cancelled():
+                self._update(job_id, FAILED, error="Cancelled: server shutting down")
+                self._futures.pop(job_id, None)
+        self._executor = None
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generation metrics
+Aggregates Ollama timing/usage fields and client-side latency into
+counters and histograms, rendered in the Prometheus text format
+"""
+
+import threading
+from typing import Optional
+
+# Histogram buckets in seconds; generations range from sub-second cache-warm
+# calls to multi-minute cold loads of large vision models
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# Labels every generation metric carries
+LABELS = ("model", "target_model", "prompt_type", "mode")
+
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+
+class _Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, key: tuple, value: float):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names: tuple) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.series.items()):
+            labels = _format_labels(label_names, key)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+class _Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, key: tuple, amount: float = 1):
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self, label_names: tuple) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{_format_labels(label_names, key)}}} {value}")
+        return lines
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class GenerationMetrics:
+    """Thread-safe per-process metrics for Ollama generations.
+
+    record() takes the final Ollama result (the non-streaming response
+    or the last streamed chunk) and the client-side wall time of the
+    upstream request. Queue time is the part of Ollama's total_duration
+    not spent loading, evaluating the prompt or generating, which is
+    mostly time spent waiting for a free slot on the server.
+    count() tracks outcomes, including exact and semantic cache hits and
+    coalesced calls that never reach Ollama.
+    """
+
+    def __init__(self, prefix: str = "promptgen"):
+        self._lock = threading.Lock()
+        self.requests = _Counter(f"{prefix}_requests_total",
+                                 "Generations by outcome (ok, error, cancelled, cached, semantic, coalesced)")
+        self.prompt_tokens = _Counter(f"{prefix}_prompt_tokens_total", "Prompt tokens evaluated by Ollama")
+        self.eval_tokens = _Counter(f"{prefix}_eval_tokens_total", "Tokens generated by Ollama")
+        self.histograms = {
+            'wall': _Histogram(f"{prefix}_wall_seconds", "Client-side time from sending the request to the last token"),
+            'first_token': _Histogram(f"{prefix}_first_token_seconds", "Client-side time to the first streamed token"),
+            'total': _Histogram(f"{prefix}_ollama_total_seconds", "Ollama total_duration"),
+            'load': _Histogram(f"{prefix}_ollama_load_seconds", "Ollama load_duration (model load)"),
+            'prompt_eval': _Histogram(f"{prefix}_ollama_prompt_eval_seconds", "Ollama prompt_eval_duration"),
+            'eval': _Histogram(f"{prefix}_ollama_eval_seconds", "Ollama eval_duration (token generation)"),
+            'queue': _Histogram(f"{prefix}_ollama_queue_seconds", "Ollama total_duration not spent loading or evaluating"),
+        }
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(labels.get(name) or "" for name in LABELS)
+
+    def count(self, labels: dict, status: str):
+        """Count one generation outcome"""
+        with self._lock:
+            self.requests.inc(self._key(labels) + (status,))
+
+    def record(self, labels: dict, result: dict, wall: float, first_token: Optional[float] = None):
+        """Record a completed upstream generation"""
+        key = self._key(labels)
+        durations = {field: result.get(f"{field}_duration", 0) / NANOSECONDS
+                     for field in ('total', 'load', 'prompt_eval', 'eval')}
+
+        with self._lock:
+            self.requests.inc(key + ("ok",))
+            self.histograms['wall'].observe(key, wall)
+            if first_token is not None:
+                self.histograms['first_token'].observe(key, first_token)
+            if result.get('total_duration'):
+                for field, seconds in durations.items():
+                    self.histograms[field].observe(key, seconds)
+                queued = durations['total'] - durations['load'] - durations['prompt_eval'] - durations['eval']
+                self.histograms['queue'].observe(key, max(0.0, queued))
+            self.prompt_tokens.inc(key, result.get('prompt_eval_count', 0))
+            self.eval_tokens.inc(key, result.get('eval_count', 0))
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        with self._lock:
+            lines = self.requests.render(LABELS + ("status",))
+            lines += self.prompt_tokens.render(LABELS)
+            lines += self.eval_tokens.render(LABELS)
+            for histogram in self.histograms.values():
+                lines += histogram.render(LABELS)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mock Ollama server for benchmarks and offline development
+Implements /api/tags, /api/show and /api/generate (streaming and not) with
+configurable latency, generation speed, server-side parallelism and failures,
+and /api/embed with bag-of-words vectors (same words, same vector)
+
+Usage: python mock_ollama.py --port 11435 --tokens-per-sec 50 --failure-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEFAULT_MODELS = ("dolphin-mistral:latest", "llava:latest")
+
+# Text the mock "generates", cycled token by token
+WORDS = ("masterpiece, best quality, highly detailed, cinematic lighting, sharp focus, "
+         "photorealistic, dramatic shadows, depth of field, vivid colors, 8k,").split()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early are expected (cancelled streams, injected disconnects)
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockOllama:
+    """A threaded HTTP server that behaves like Ollama from the client's side.
+
+    latency: seconds before the first token (prompt evaluation)
+    tokens_per_sec: generation speed once tokens flow
+    max_tokens: tokens per response, further capped by options.num_predict
+    load_time: extra seconds when a model is not loaded; models stay loaded
+        for the request's keep_alive (default 300 seconds)
+    num_parallel: requests processed at once; the rest wait, like OLLAMA_NUM_PARALLEL
+    failure_rate: share of generations answered with HTTP 500
+    disconnect_rate: share of generations where the connection drops mid-response
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 models: tuple = DEFAULT_MODELS,
+                 latency: float = 0.05,
+                 tokens_per_sec: float = 200.0,
+                 max_tokens: int = 40,
+                 load_time: float = 0.0,
+                 num_parallel: int = 4,
+                 failure_rate: float = 0.0,
+                 disconnect_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.models = list(models)
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.max_tokens = max_tokens
+        self.load_time = load_time
+        self.failure_rate = failure_rate
+        self.disconnect_rate = disconnect_rate
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, num_parallel))
+        self._loaded = {}  # model -> monotonic expiry
+        self.requests = {}  # path -> count
+
+        self.server = _Server((host, port), _make_handler(self))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOllama":
+        """Serve on a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _count(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def _chance(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def _load(self, model: str, keep_alive) -> float:
+        """Mark model loaded, returning the load time this request pays"""
+        seconds = _keep_alive_seconds(keep_alive)
+        now = time.monotonic()
+        with self._lock:
+            cold = self._loaded.get(model, 0) < now
+            self._loaded[model] = now + seconds if seconds >= 0 else float("inf")
+        if cold and self.load_time:
+            time.sleep(self.load_time)
+            return self.load_time
+        return 0.0
+
+
+def _keep_alive_seconds(keep_alive) -> float:
+    if keep_alive is None:
+        return 300.0
+    if isinstance(keep_alive, (int, float)):
+        return float(keep_alive)
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for suffix in sorted(units, key=len, reverse=True):
+        if keep_alive.endswith(suffix):
+            return float(keep_alive[:-len(suffix)]) * units[suffix]
+    return float(keep_alive)
+
+
+def _make_handler(mock: MockOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, body: dict, status: int = 200):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self) -> dict:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            mock._count(self.path)
+            if self.path == "/api/tags":
+                self._send_json({"models": [{"name": name, "model": name, "size": 0}
+                                            for name in mock.models]})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            mock._count(self.path)
+            body = self._read_json()
+            if self.path == "/api/show":
+                self._show(body)
+            elif self.path == "/api/generate":
+                self._generate(body)
+            elif self.path == "/api/embed":
+                self._embed(body)
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def _show(self, body: dict):
+            name = body.get("model") or body.get("name", "")
+            if name not in mock.models and f"{name}:latest" not in mock.models:
+                self._send_json({"error": f"model '{name}' not found"}, 404)
+                return
+            self._send_json({
+                "modelfile": f"FROM {name}",
+                "parameters": "",
+                "template": "{{ .Prompt }}",
+                "details": {"format": "gguf", "family": "mock", "parameter_size": "7B",
+                            "quantization_level": "Q4_0"},
+                "capabilities": ["completion", "vision"] if "llava" in name else ["completion"]
+            })
+
+        def _embed(self, body: dict):
+            texts = body.get("input", "")
+            embeddings = []
+            for text in [texts] if isinstance(texts, str) else texts:
+                vector = [0.0] * 64
+                for word in text.lower().split():
+                    vector[int(hashlib.md5(word.strip(",.").encode("utf-8")).hexdigest(), 16) % 64] += 1.0
+                embeddings.append(vector)
+            self._send_json({"model": body.get("model", ""), "embeddings": embeddings})
+
+        def _generate(self, body: dict):
+            model = body.get("model", "")
+            if model not in mock.models and f"{model}:latest" not in mock.models:
+                self._send_json({"error": f"model '{model}' not found, try pulling it first"}, 404)
+                return
+
+            start = time.monotonic()
+            with mock._slots:
+                load = mock._load(model, body.get("keep_alive"))
+
+                if mock._chance(mock.failure_rate):
+                    self._send_json({"error": "mock failure injected"}, 500)
+                    return
+
+                # An empty prompt only loads the model
+                if not body.get("prompt"):
+                    self._send_json({"model": model, "response": "", "done": True, "done_reason": "load"})
+                    return
+
+                limit = body.get("options", {}).get("num_predict") or mock.max_tokens
+                count = max(1, min(limit, mock.max_tokens))
+                tokens = [WORDS[i % len(WORDS)] + " " for i in range(count)]
+                prompt_tokens = len(body.get("prompt", "").split()) + len(body.get("system", "").split())
+
+                time.sleep(mock.latency)
+                prompt_eval = mock.latency
+                disconnect = mock._chance(mock.disconnect_rate)
+                interval = 1.0 / mock.tokens_per_sec if mock.tokens_per_sec > 0 else 0.0
+
+                def final(eval_time):
+                    return {
+                        "model": model,
+                        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                        "done": True,
+                        "done_reason": "stop" if count < limit else "length",
+                        "context": list(body.get("context") or []) + list(range(prompt_tokens + count)),
+                        "total_duration": int((time.monotonic() - start) * 1e9),
+                        "load_duration": int(load * 1e9),
+                        "prompt_eval_count": prompt_tokens,
+                        "prompt_eval_duration": int(prompt_eval * 1e9),
+                        "eval_count": count,
+                        "eval_duration": int(eval_time * 1e9),
+                    }
+
+                if body.get("stream", True):
+                    self._stream(model, tokens, interval, disconnect, final)
+                    return
+
+                if disconnect:
+                    self.close_connection = True
+                    return
+                time.sleep(interval * count)
+                result = final(interval * count)
+                result["response"] = "".join(tokens)
+                self._send_json(result)
+
+        def _stream(self, model, tokens, interval, disconnect, final):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write(chunk: dict):
+                data = json.dumps(chunk).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            eval_start = time.monotonic()
+            try:
+                for i, token in enumerate(tokens):
+                    if disconnect and i == len(tokens) // 2:
+                        self.close_connection = True
+                        return
+                    time.sleep(interval)
+                    write({"model": model, "response": token, "done": False})
+                last = final(time.monotonic() - eval_start)
+                last["response"] = ""
+                write(last)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading early
+                self.close_connection = True
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", default=",".join(DEFAULT_MODELS),
+                        help="Comma-separated model names to advertise")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--max-tokens", type=int, default=40)
+    parser.add_argument("--load-time", type=float, default=0.0, help="Seconds to load a cold model")
+    parser.add_argument("--num-parallel", type=int, default=4)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of HTTP 500 answers")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="Share of responses cut off mid-way")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    mock = MockOllama(
+        host=args.host,
+        port=args.port,
+        models=tuple(name.strip() for name in args.models.split(",") if name.strip()),
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        max_tokens=args.max_tokens,
+        load_time=args.load_time,
+        num_parallel=args.num_parallel,
+        failure_rate=args.failure_rate,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed
+    )
+    print(f"🧪 Mock Ollama listening on {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
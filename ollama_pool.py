@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ollama backend pool
+Routes each request to the least-loaded healthy backend serving the model
+and re-probes failed backends in the background
+"""
+
+import os
+import threading
+from typing import Iterable, List, Optional, Union
+
+import requests
+
+# Seconds between background probes of an ejected backend
+PROBE_INTERVAL = float(os.getenv("OLLAMA_PROBE_INTERVAL", "10"))
+
+
+def parse_hosts(hosts: Union[str, Iterable[str]]) -> List[str]:
+    """Normalise a host list or comma-separated string, dropping blanks and duplicates"""
+    if isinstance(hosts, str):
+        hosts = hosts.split(",")
+    parsed = []
+    for host in hosts:
+        host = host.strip().rstrip('/')
+        if host and host not in parsed:
+            parsed.append(host)
+    return parsed
+
+
+def _model_key(name: str) -> str:
+    """Ollama treats 'llava' and 'llava:latest' as the same model"""
+    return name if ":" in name else f"{name}:latest"
+
+
+class Backend:
+    """One Ollama server and what the pool knows about it"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.healthy = True
+        self.models = None  # Unknown until the first successful /api/tags
+        self.outstanding = 0
+        self.dispatched = 0
+        self.last_error = None
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or _model_key(model) in self.models
+
+    def status(self) -> dict:
+        return {
+            'host': self.host,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'models_count': len(self.models) if self.models is not None else None,
+            'last_error': self.last_error
+        }
+
+
+class BackendPool:
+    """Least-loaded routing across one or more Ollama hosts.
+
+    acquire() picks the healthy backend with the fewest outstanding
+    requests that has the model installed (ties go to the one used least
+    recently), and release() hands it back. A backend released as
+    failed is ejected from routing and probed every probe_interval
+    seconds on a background thread until /api/tags answers again. When
+    every backend is ejected, requests still go to the least-loaded one
+    so callers see the real connection error.
+    """
+
+    def __init__(self,
+                 hosts: Union[str, Iterable[str]],
+                 session: requests.Session,
+                 probe_interval: float = PROBE_INTERVAL):
+        hosts = parse_hosts(hosts)
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+
+        self.backends = [Backend(host) for host in hosts]
+        self.session = session
+        self.probe_interval = probe_interval
+
+        self._lock = threading.Lock()
+        self._prober = None
+        self._closed = threading.Event()
+
+    @property
+    def hosts(self) -> List[str]:
+        return [backend.host for backend in self.backends]
+
+    def acquire(self, model: Optional[str] = None, exclude: Iterable[str] = ()) -> Backend:
+        """Reserve the best backend for model, skipping hosts in exclude where possible"""
+        with self._lock:
+            candidates = [b for b in self.backends if b.host not in exclude] or self.backends
+            healthy = [b for b in candidates if b.healthy] or candidates
+            serving = [b for b in healthy if model is None or b.serves(model)] or healthy
+            backend = min(serving, key=lambda b: (b.outstanding, b.dispatched))
+            backend.outstanding += 1
+            backend.dispatched += 1
+            return backend
+
+    def release(self, backend: Backend, error: Optional[Exception] = None):
+        """Return a backend from acquire(), ejecting it if the request failed to reach it"""
+        with self._lock:
+            backend.outstanding -= 1
+        if error is not None:
+            self.eject(backend, error)
+
+    def serving(self, model: str) -> List[Backend]:
+        """Healthy backends that have model (or whose models are not known yet)"""
+        with self._lock:
+            return [b for b in self.backends if b.healthy and b.serves(model)]
+
+    def has_alternative(self, model: Optional[str], exclude: Iterable[str]) -> bool:
+        """Whether a healthy backend outside exclude could serve model"""
+        with self._lock:
+            return any(b.healthy and b.host not in exclude and (model is None or b.serves(model))
+                       for b in self.backends)
+
+    def eject(self, backend: Backend, error: Exception):
+        """Stop routing to backend until a background probe succeeds"""
+        with self._lock:
+            backend.last_error = str(error)
+            if not backend.healthy:
+                return
+            backend.healthy = False
+            print(f"⚠️  Ollama backend {backend.host} ejected: {error}")
+            # Started lazily so a preloaded app never forks with live threads
+            if self._prober is None and not self._closed.is_set():
+                self._prober = threading.Thread(target=self._probe_loop, name="ollama-probe", daemon=True)
+                self._prober.start()
+
+    def record(self, backend: Backend, models: Optional[list], error: Optional[Exception] = None):
+        """Record the outcome of an /api/tags request to backend"""
+        if error is not None:
+            self.eject(backend, error)
+            return
+        with self._lock:
+            backend.models = {_model_key(name) for name in models}
+            backend.last_error = None
+            if not backend.healthy:
+                backend.healthy = True
+                print(f"✓ Ollama backend {backend.host} restored")
+
+    def fetch_models(self, backend: Backend, timeout: float = 10) -> list:
+        """GET /api/tags from backend, recording the outcome; raises on failure"""
+        try:
+            response = self.session.get(f"{backend.host}/api/tags", timeout=timeout)
+            if response.status_code != 200:
+                raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+            models = [model['name'] for model in response.json().get('models', [])]
+        except Exception as e:
+            self.record(backend, None, e)
+            raise
+        self.record(backend, models)
+        return models
+
+    def status(self) -> list:
+        """Per-backend health, load and model count"""
+        with self._lock:
+            return [backend.status() for backend in self.backends]
+
+    def close(self):
+        """Stop the background prober"""
+        self._closed.set()
+
+    def _probe_loop(self):
+        while not self._closed.wait(self.probe_interval):
+            with self._lock:
+                ejected = [b for b in self.backends if not b.healthy]
+                if not ejected:
+                    self._prober = None
+                    return
+            for backend in ejected:
+                try:
+                    self.fetch_models(backend, timeout=5)
+                except Exception:
+                    pass
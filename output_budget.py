@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Output budgets for streamed generations
+Counts keywords or words as tokens arrive so a stream can be stopped as
+soon as the prompt is long enough, trimmed at a clean boundary
+"""
+
+import re
+
+KEYWORDS = "keywords"
+WORDS = "words"
+
+# The end of a sentence: terminal punctuation (plus closing quotes/brackets) before whitespace
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*(?=\s)')
+_WORD = re.compile(r'\S+(?=\s)')
+
+
+class OutputBudget:
+    """Track a streamed prompt against a keyword or word limit.
+
+    feed() takes each token and returns the text that is safe to show:
+    complete keywords (through their comma) or complete sentences. Text
+    that might still be trimmed is held back. Once the limit is reached,
+    `reached` is set, feed() returns the final piece up to the cut, and
+    the caller should stop reading. If the stream ends first, finish()
+    releases whatever was held back.
+    """
+
+    def __init__(self, unit: str, limit: int):
+        if unit not in (KEYWORDS, WORDS):
+            raise ValueError(f"Unknown budget unit: {unit}")
+        self.unit = unit
+        self.limit = max(1, limit)
+        self.text = ""
+        self.reached = False
+        self._emitted = 0
+        self._scanned = 0
+        self._keywords = 0
+        self._in_keyword = False
+
+    def __repr__(self) -> str:
+        return f"{self.unit}:{self.limit}"
+
+    @property
+    def released(self) -> str:
+        """Everything released so far"""
+        return self.text[:self._emitted]
+
+    def feed(self, token: str) -> str:
+        """Add a token and return the text that can be released"""
+        if self.reached:
+            return ""
+        self.text += token
+        if self.unit == KEYWORDS:
+            safe, cut = self._scan_keywords()
+        else:
+            safe, cut = self._scan_words()
+
+        if cut is not None:
+            self.reached = True
+            safe = cut
+        release = self.text[self._emitted:safe]
+        self._emitted = max(self._emitted, safe)
+        if self.reached:
+            # A cut mid-sentence should not end on a dangling separator
+            return release.rstrip().rstrip(",;:")
+        return release
+
+    def finish(self) -> str:
+        """Release the held-back text once the stream has ended on its own"""
+        if self.reached:
+            return ""
+        release = self.text[self._emitted:]
+        self._emitted = len(self.text)
+        return release
+
+    def apply(self, text: str) -> str:
+        """Trim a complete text the same way a stream would have been"""
+        return (self.feed(text) + self.finish()).strip()
+
+    def _scan_keywords(self) -> tuple:
+        """Return (safe position, cut position or None) for comma/newline separated keywords"""
+        safe = self._emitted
+        for i in range(self._scanned, len(self.text)):
+            char = self.text[i]
+            if char in ",\n":
+                if self._in_keyword:
+                    self._keywords += 1
+                    self._in_keyword = False
+                    if self._keywords >= self.limit:
+                        self._scanned = i + 1
+                        return safe, i
+                safe = i + 1
+            elif not char.isspace():
+                self._in_keyword = True
+        self._scanned = len(self.text)
+        return safe, None
+
+    def _scan_words(self) -> tuple:
+        """Return (safe position, cut position or None), preferring to cut after a sentence"""
+        sentence_ends = [match.end() for match in _SENTENCE_END.finditer(self.text)]
+        safe = sentence_ends[-1] if sentence_ends else self._emitted
+
+        words = list(_WORD.finditer(self.text))
+        if len(words) < self.limit:
+            return max(safe, self._emitted), None
+
+        limit_end = words[self.limit - 1].end()
+        complete = [end for end in sentence_ends if end <= limit_end]
+        cut = complete[-1] if complete else limit_end
+        return max(safe, self._emitted), max(cut, self._emitted)
@@ -6,12 +6,29 @@ Generates detailed image and video prompts with optional image reference support
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import hashlib
 import json
-import base64
+import sqlite3
 import sys
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from circuit_breaker import CircuitBreaker
+from history import GenerationHistory
+from image_preprocessing import ImagePreprocessor
+from metrics import GenerationMetrics
+from ollama_pool import BackendPool, parse_hosts
+from output_budget import KEYWORDS, WORDS, OutputBudget
+from response_cache import ResponseCache, payload_key
+from semantic_cache import RETURN, SemanticCache
+from sessions import PromptSession, SessionStore
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Union
 
 # Set UTF-8 encoding for Windows console
 if sys.platform == "win32":
@@ -20,115 +37,269 @@ if sys.platform == "win32":
     except:
         pass
 
-class PromptGenerator:
-    def __init__(self, ollama_host: str = None):
-        # Support environment variable for Docker/custom setups
-        self.ollama_host = ollama_host or os.getenv("OLLAMA_HOST", "http://localhost:11434")
-
-        # Try to auto-detect best available models
-        self.text_model = self._find_best_text_model()
-        self.vision_model = self._find_best_vision_model()
-
-    def check_ollama_connection(self) -> bool:
-        """Check if Ollama is running"""
-        try:
-            response = requests.get(f"{self.ollama_host}/api/tags", timeout=10)
-            return response.status_code == 200
-        except requests.exceptions.ConnectionError:
-            return False
-        except requests.exceptions.Timeout:
-            return False
-        except Exception:
-            return False
-
-    def test_ollama_connection(self) -> dict:
-        """Test Ollama connection with detailed diagnostics"""
-        result = {
-            'success': False,
-            'ollama_host': self.ollama_host,
-            'error': None,
-            'error_type': None,
-            'models_count': 0,
-            'response_time_ms': 0
-        }
-
-        import time
-        start_time = time.time()
-
+# How long a fetched model list is reused before /api/tags is queried again
+MODEL_CACHE_TTL = float(os.getenv("OLLAMA_MODEL_CACHE_TTL", "30"))
+# Failed fetches are retried sooner so a recovered host is noticed quickly
+MODEL_CACHE_ERROR_TTL = 5.0
+# Seconds between background re-detections of the default models (start_model_resolver)
+MODEL_REFRESH_INTERVAL = float(os.getenv("OLLAMA_MODEL_REFRESH", "300"))
+
+# Default model detection states, as reported by model_status()
+MODELS_PENDING = "pending"      # Not detected yet; the first use detects them
+MODELS_RESOLVING = "resolving"  # First detection in flight
+MODELS_RESOLVED = "resolved"    # Picked from the installed models
+MODELS_FALLBACK = "fallback"    # No model list available; built-in names in use until one is
+
+# Connection pool size for the keep-alive HTTP session
+POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "10"))
+# Retries (with exponential backoff) for idempotent GET requests
+HTTP_RETRIES = int(os.getenv("OLLAMA_HTTP_RETRIES", "2"))
+HTTP_BACKOFF = 0.3
+# Requests the Ollama server processes in parallel (mirrors the server's own setting)
+NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+# Share one upstream request between identical concurrent generations
+COALESCE = os.getenv("OLLAMA_COALESCE", "1") != "0"
+# Seconds between checks of a caller's cancel flag while it waits on a shared request
+CANCEL_POLL_INTERVAL = 0.25
+# How long Ollama keeps a model loaded after each request ("30m", "-1" = forever);
+# unset leaves it to the server. The TEXT/VISION variants apply to the detected models.
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE")
+TEXT_KEEP_ALIVE = os.getenv("OLLAMA_TEXT_KEEP_ALIVE")
+VISION_KEEP_ALIVE = os.getenv("OLLAMA_VISION_KEEP_ALIVE")
+# Stop streaming generations once the target's keyword/word budget is met
+EARLY_STOP = os.getenv("PROMPT_EARLY_STOP", "0") != "0"
+# Seconds between keep-warm pings of the text and vision models (0 disables)
+KEEP_WARM_INTERVAL = float(os.getenv("OLLAMA_KEEP_WARM_INTERVAL", "0"))
+# Model loads can take minutes for large models
+WARM_UP_TIMEOUT = 300
+# Breakdowns iter_breakdown_images keeps for duplicate images; older ones are analysed again
+BREAKDOWN_RESULTS_KEPT = 256
+# Seconds to connect to Ollama, to wait for the first token (model load and
+# prompt evaluation) and for a whole generation; 0 means no limit
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "10"))
+FIRST_TOKEN_TIMEOUT = float(os.getenv("OLLAMA_FIRST_TOKEN_TIMEOUT", "120"))
+TOTAL_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+
+
+# A reference image: file path, raw bytes, or a binary file-like object
+ImageSource = Union[str, os.PathLike, bytes, BinaryIO]
+
+
+def read_image(image: ImageSource) -> bytes:
+    """Read the bytes of an ImageSource"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if hasattr(image, 'read'):
+        # Rewind so the same upload can be encoded more than once
+        if hasattr(image, 'seek'):
+            image.seek(0)
+        return image.read()
+    with open(image, 'rb') as image_file:
+        return image_file.read()
+
+
+def parse_keep_alive(value: Union[str, int, float]) -> Union[str, int, float]:
+    """Ollama reads a number as seconds and a string as a duration ("10m")"""
+    if isinstance(value, str):
+        for number in (int, float):
+            try:
+                return number(value)
+            except ValueError:
+                pass
+    return value
+
+
+def keep_alive_config(keep_alive: Union[str, int, float, dict, None] = None) -> dict:
+    """Normalise a keep_alive setting to {model, "text", "vision" or "*": value}.
+
+    None reads the OLLAMA_*KEEP_ALIVE environment variables; a single
+    value applies to every model.
+    """
+    if keep_alive is None:
+        keep_alive = {"*": KEEP_ALIVE, "text": TEXT_KEEP_ALIVE, "vision": VISION_KEEP_ALIVE}
+    elif not isinstance(keep_alive, dict):
+        keep_alive = {"*": keep_alive}
+    return {key: parse_keep_alive(value) for key, value in keep_alive.items() if value is not None}
+
+
+class OllamaError(RuntimeError):
+    """Ollama answered with an error instead of a generation"""
+
+
+class GenerationTimeout(OllamaError):
+    """A generation ran past its total timeout and was abandoned"""
+
+
+class GenerationCancelled(OllamaError):
+    """A generation was abandoned because its caller cancelled it"""
+
+
+class CircuitOpenError(OllamaError):
+    """The request was refused without contacting Ollama because it keeps failing"""
+
+    def __init__(self, circuit: dict):
+        self.circuit = circuit
+        self.retry_after = max(1, int(circuit['retry_after'] + 0.999))
+        super().__init__(f"Error: Ollama is unavailable ({circuit['consecutive_failures']} consecutive failures, "
+                         f"last: {circuit['last_error']}) - retry in {self.retry_after}s")
+
+    def to_dict(self) -> dict:
+        return {'error': str(self), 'error_type': 'circuit_open', 'retry_after': self.retry_after,
+                'circuit': self.circuit}
+
+
+class Timeouts:
+    """Time limits for one generation, in seconds (None or 0 for no limit).
+
+    connect: opening the connection to Ollama
+    first_token: waiting for the first token, which covers model loading
+        and prompt evaluation; also the longest gap allowed between tokens
+    total: the whole generation, checked as tokens arrive
+    """
+
+    def __init__(self,
+                 connect: Optional[float] = CONNECT_TIMEOUT,
+                 first_token: Optional[float] = FIRST_TOKEN_TIMEOUT,
+                 total: Optional[float] = TOTAL_TIMEOUT):
+        self.connect = connect or None
+        self.first_token = first_token or None
+        self.total = total or None
+
+    def __repr__(self) -> str:
+        return f"Timeouts(connect={self.connect}, first_token={self.first_token}, total={self.total})"
+
+    def requests_timeout(self) -> tuple:
+        """(connect, read) timeout for requests; a read never outlasts the total"""
+        read = min(t for t in (self.first_token, self.total) if t) if (self.first_token or self.total) else None
+        return self.connect, read
+
+
+class _SharedCall:
+    """A call in progress whose outcome is shared by every caller waiting on it.
+
+    Callers that join() count as subscribers and may each stop waiting on
+    their own cancel flag. Once the last subscriber has left the call is
+    abandoned: is_set() turns True, so the call can serve as the cancel
+    flag of the work behind it, and later callers start a new call.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.subscribers = 0
+        self.abandoned = False
+
+    def join(self) -> bool:
+        """Subscribe to the outcome; False if the call was already abandoned"""
+        with self.lock:
+            if self.abandoned:
+                return False
+            self.subscribers += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done.is_set():
+                self.abandoned = True
+
+    def is_set(self) -> bool:
+        """Whether every subscriber has left before the outcome was ready"""
+        return self.abandoned
+
+    def wait(self, cancel: Optional[threading.Event] = None):
+        """Return the shared result or raise the shared error; GenerationCancelled once cancel is set"""
+        while not self.done.wait(None if cancel is None else CANCEL_POLL_INTERVAL):
+            if cancel.is_set():
+                raise GenerationCancelled("Error: Generation cancelled")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _StreamFanout:
+    """Tokens from one upstream stream, replayed to every subscriber.
+
+    Subscribers that join late first receive the tokens already buffered.
+    The pump stops reading upstream once no subscribers remain.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.tokens = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+
+    def join(self):
+        with self.cond:
+            self.subscribers += 1
+
+    def publish(self, token: str):
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(self, error: Optional[Exception] = None):
+        with self.cond:
+            self.finished = True
+            self.error = error
+            self.cond.notify_all()
+
+    def read(self) -> Iterator[str]:
+        """Yield buffered and future tokens; call join() first"""
+        position = 0
         try:
-            response = requests.get(f"{self.ollama_host}/api/tags", timeout=10)
-            result['response_time_ms'] = int((time.time() - start_time) * 1000)
-
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                result['success'] = True
-                result['models_count'] = len(models)
-            else:
-                result['error'] = f"HTTP {response.status_code}: {response.text[:200]}"
-                result['error_type'] = 'http_error'
-
-        except requests.exceptions.ConnectionError as e:
-            result['response_time_ms'] = int((time.time() - start_time) * 1000)
-            result['error'] = f"Connection refused - Ollama may not be running at {self.ollama_host}"
-            result['error_type'] = 'connection_refused'
-        except requests.exceptions.Timeout:
-            result['response_time_ms'] = int((time.time() - start_time) * 1000)
-            result['error'] = f"Connection timed out after 10 seconds"
-            result['error_type'] = 'timeout'
-        except requests.exceptions.InvalidURL:
-            result['response_time_ms'] = int((time.time() - start_time) * 1000)
-            result['error'] = f"Invalid URL: {self.ollama_host}"
-            result['error_type'] = 'invalid_url'
-        except Exception as e:
-            result['response_time_ms'] = int((time.time() - start_time) * 1000)
-            result['error'] = str(e)
-            result['error_type'] = 'unknown'
+            while True:
+                with self.cond:
+                    while position >= len(self.tokens) and not self.finished:
+                        self.cond.wait()
+                    new_tokens = self.tokens[position:]
+                    position = len(self.tokens)
+                    finished, error = self.finished, self.error
+                yield from new_tokens
+                if finished:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+
+
+def _create_session(pool_size: int, retries: int) -> requests.Session:
+    """Create a keep-alive session with a connection pool and GET retries"""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),  # POST /api/generate is not idempotent
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
 
-        return result
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-    def set_ollama_host(self, host: str) -> dict:
-        """Update Ollama host and re-detect models"""
-        old_host = self.ollama_host
-        self.ollama_host = host.rstrip('/')
 
-        # Test the new connection
-        test_result = self.test_ollama_connection()
+class PromptBuilder:
+    """Model selection and Ollama payload construction shared by the sync and async clients.
 
-        if test_result['success']:
-            # Re-detect models with new host
-            self.text_model = self._find_best_text_model()
-            self.vision_model = self._find_best_vision_model()
-            return {
-                'success': True,
-                'ollama_host': self.ollama_host,
-                'text_model': self.text_model,
-                'vision_model': self.vision_model,
-                'models_count': test_result['models_count']
-            }
-        else:
-            # Revert to old host on failure
-            self.ollama_host = old_host
-            return {
-                'success': False,
-                'error': test_result['error'],
-                'error_type': test_result['error_type']
-            }
+    Nothing here talks to the network except the model-list fallback
+    in _find_best_*_model, which subclasses provide via list_models().
+    """
 
-    def list_models(self) -> list:
-        """List available Ollama models"""
-        try:
-            response = requests.get(f"{self.ollama_host}/api/tags", timeout=10)
-            if response.status_code == 200:
-                return [model['name'] for model in response.json().get('models', [])]
-        except requests.exceptions.RequestException as e:
-            print(f"Warning: Could not list models: {e}")
-        except Exception as e:
-            print(f"Warning: Unexpected error listing models: {e}")
-        return []
-
-    def _find_best_text_model(self) -> str:
+    def _find_best_text_model(self, models: Optional[list] = None) -> str:
         """Auto-detect best uncensored text model"""
-        models = self.list_models()
+        if models is None:
+            models = self.list_models()
 
         # Priority order for uncensored models
         preferred_models = [
@@ -153,9 +324,10 @@ class PromptGenerator:
         # Fallback to first available model
         return models[0] if models else "dolphin-mistral"
 
-    def _find_best_vision_model(self) -> str:
+    def _find_best_vision_model(self, models: Optional[list] = None) -> str:
         """Auto-detect best vision model"""
-        models = self.list_models()
+        if models is None:
+            models = self.list_models()
 
         # Priority order for vision models
         preferred_models = [
@@ -174,10 +346,26 @@ class PromptGenerator:
         # Fallback
         return models[0] if models else "llava"
 
-    def encode_image(self, image_path: str) -> str:
-        """Encode image to base64"""
-        with open(image_path, 'rb') as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+    def _keep_alive_for(self, model: Optional[str]):
+        """keep_alive for model: its own entry, then its role ("vision"/"text"), then "*" """
+        for key in (model,
+                    "vision" if model == self.vision_model else None,
+                    "text" if model == self.text_model else None,
+                    "*"):
+            if key is not None and key in self.keep_alive:
+                return self.keep_alive[key]
+        return None
+
+    def _with_keep_alive(self, payload: dict) -> dict:
+        """Add the configured keep_alive to an /api/generate payload"""
+        if 'keep_alive' in payload:
+            return payload
+        keep_alive = self._keep_alive_for(payload.get('model'))
+        return payload if keep_alive is None else dict(payload, keep_alive=keep_alive)
+
+    def encode_image(self, image_path: ImageSource) -> str:
+        """Encode image (path, bytes or file-like) to base64, preprocessed for the vision model"""
+        return self.image_preprocessor.encode(read_image(image_path))
 
     def _get_image_system_prompt(self, target_model: str, word_limit: int) -> str:
         """Get optimized system prompt for image generation models"""
@@ -234,14 +422,15 @@ Example: "POV, fucking, doggy style, ass bouncing, moaning, camera close-up, 30
 Use EXPLICIT keywords: fucking, cumming, sucking, riding, wet, hard, naked, tits, ass, pussy
 Maximum {word_limit} keywords."""
 
-    def generate_prompt(self,
-                       user_input: str,
-                       prompt_type: str = "image",
-                       image_path: Optional[str] = None,
-                       model_override: Optional[str] = None,
-                       word_limit: int = 50,
-                       target_model: str = "stable-diffusion") -> str:
-        """Generate uncensored prompt using Ollama with target model optimization"""
+    def _build_generate_payload(self,
+                                user_input: str,
+                                prompt_type: str,
+                                image_data: Optional[str],
+                                model_override: Optional[str],
+                                word_limit: int,
+                                target_model: str,
+                                stream: bool) -> dict:
+        """Build the /api/generate payload shared by generate_prompt and generate_prompt_stream"""
 
         # Build system prompt based on target model and word limit
         if prompt_type.lower() == "image":
@@ -250,7 +439,7 @@ Maximum {word_limit} keywords."""
             system_prompt = self._get_video_system_prompt(target_model, word_limit)
 
         # Select model
-        if image_path:
+        if image_data:
             model = model_override or self.vision_model
             # Build prompt with image analysis
             analysis_prompt = f"""Describe as SD prompt keywords: {user_input}
@@ -264,8 +453,8 @@ Comma-separated keywords only. Include what you see in image."""
                 "model": model,
                 "prompt": analysis_prompt,
                 "system": system_prompt,
-                "images": [self.encode_image(image_path)],
-                "stream": False,
+                "images": [image_data],
+                "stream": stream,
                 "options": {
                     "num_predict": token_limit,
                     "temperature": 0.9,
@@ -286,7 +475,7 @@ Comma-separated keywords only. Maximum {word_limit} keywords."""
                 "model": model,
                 "prompt": full_prompt,
                 "system": system_prompt,
-                "stream": False,
+                "stream": stream,
                 "options": {
                     "num_predict": token_limit,
                     "temperature": 0.9,
@@ -295,41 +484,64 @@ Comma-separated keywords only. Maximum {word_limit} keywords."""
                 }
             }
 
-        # Send request to Ollama
-        try:
-            response = requests.post(
-                f"{self.ollama_host}/api/generate",
-                json=payload,
-                timeout=120
-            )
+        return payload
 
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                return f"Error: {response.status_code} - {response.text}"
-        except Exception as e:
-            return f"Error generating prompt: {str(e)}"
+    def _output_budget(self, prompt_type: str, target_model: str, word_limit: int) -> OutputBudget:
+        """The keyword or word budget the system prompt asks the model to stay within"""
+        if prompt_type.lower() == "image":
+            multipliers = {"flux": 3, "sd3": 2}
+        else:  # video
+            multipliers = {"sora": 3, "veo3": 2}
+        if target_model in multipliers:
+            return OutputBudget(WORDS, word_limit * multipliers[target_model])
+        return OutputBudget(KEYWORDS, word_limit)
+
+    def _build_refine_payload(self, session: PromptSession, instruction: str, stream: bool) -> dict:
+        """Build the payload for a follow-up turn that edits session.last_prompt"""
+        options = {
+            "num_predict": session.word_limit * 5,
+            "temperature": 0.9,
+            "top_p": 0.95,
+            "stop": []  # No stop sequences - let it complete fully
+        }
 
-    def enhance_prompt(self, base_prompt: str, style: Optional[str] = None) -> str:
-        """Enhance an existing prompt with additional details"""
-        enhancement_request = f"Enhance this prompt with more vivid details"
-        if style:
-            enhancement_request += f" in {style} style"
-        enhancement_request += f": {base_prompt}"
+        if session.context:
+            # The system prompt and earlier turns are already in the context
+            return {
+                "model": session.model,
+                "prompt": f"""Revise the prompt: {instruction}
 
-        return self.generate_prompt(enhancement_request)
+Output ONLY the full revised prompt in the same format.""",
+                "context": session.context,
+                "stream": stream,
+                "options": options
+            }
 
-    def breakdown_image_prompt(self,
-                               user_input: str,
-                               image_path: str,
-                               prompt_type: str = "image",
-                               model_override: Optional[str] = None,
-                               word_limit: int = 50,
-                               target_model: str = "stable-diffusion") -> dict:
-        """Break down an image into separate subject and background prompts"""
+        # No reusable context: start over from the last prompt
+        if session.prompt_type.lower() == "image":
+            system_prompt = self._get_image_system_prompt(session.target_model, session.word_limit)
+        else:  # video
+            system_prompt = self._get_video_system_prompt(session.target_model, session.word_limit)
 
-        model = model_override or self.vision_model
+        return {
+            "model": session.model or self.text_model,
+            "prompt": f"""Revise this prompt: {session.last_prompt}
+Change: {instruction}
+
+Output ONLY the full revised prompt in the same format.""",
+            "system": system_prompt,
+            "stream": stream,
+            "options": options
+        }
+
+    def _build_breakdown_payloads(self,
+                                  user_input: str,
+                                  image_data: str,
+                                  prompt_type: str,
+                                  model: str,
+                                  word_limit: int,
+                                  target_model: str) -> tuple:
+        """Build the (subject, background) payloads for an image breakdown"""
 
         # Calculate token limit based on target model
         if target_model in ["flux", "sora"]:
@@ -402,7 +614,7 @@ Maximum {word_limit//2} keywords."""
             "model": model,
             "prompt": subject_prompt,
             "system": system_prompt,
-            "images": [self.encode_image(image_path)],
+            "images": [image_data],
             "stream": False,
             "options": {
                 "num_predict": (token_limit // 2) + 50,  # Extra buffer
@@ -423,7 +635,7 @@ Maximum {word_limit//2} keywords."""
             "model": model,
             "prompt": background_prompt,
             "system": system_prompt,
-            "images": [self.encode_image(image_path)],
+            "images": [image_data],
             "stream": False,
             "options": {
                 "num_predict": (token_limit // 2) + 50,  # Extra buffer
@@ -433,55 +645,1568 @@ Maximum {word_limit//2} keywords."""
             }
         }
 
+        return subject_payload, background_payload
+
+    def _metric_labels(self, payload: dict, prompt_type: str, target_model: str, mode: str) -> dict:
+        """Labels for GenerationMetrics; mode is "standard", "image", "breakdown" or "refine" """
+        return {
+            'model': payload.get('model'),
+            'target_model': target_model,
+            'prompt_type': prompt_type.lower(),
+            'mode': mode
+        }
+
+    def _format_error(self, error: Exception) -> str:
+        """Render an exception as an 'Error: ...' result string"""
+        message = str(error)
+        return message if message.startswith("Error") else f"Error: {message}"
+
+    def _combine_breakdown(self,
+                           subject_result: str,
+                           subject_ok: bool,
+                           background_result: str,
+                           background_ok: bool) -> dict:
+        """Combine whichever breakdown halves succeeded"""
+        parts = [text for text, ok in ((subject_result, subject_ok), (background_result, background_ok))
+                 if ok and text]
+        if parts:
+            combined_result = ", ".join(parts)
+        else:
+            combined_result = subject_result if not subject_ok else background_result
+
+        return {
+            'subject': subject_result,
+            'background': background_result,
+            'combined': combined_result,
+            'partial': subject_ok != background_ok
+        }
+
+
+class PromptGenerator(PromptBuilder):
+    def __init__(self,
+                 ollama_host: Union[str, Iterable[str], None] = None,
+                 model_cache_ttl: Optional[float] = None,
+                 pool_size: int = POOL_SIZE,
+                 retries: int = HTTP_RETRIES,
+                 num_parallel: int = NUM_PARALLEL,
+                 response_cache: Optional[ResponseCache] = None,
+                 image_preprocessor: Optional[ImagePreprocessor] = None,
+                 coalesce: bool = COALESCE,
+                 keep_alive: Union[str, int, float, dict, None] = None,
+                 metrics: Optional[GenerationMetrics] = None,
+                 sessions: Optional[SessionStore] = None,
+                 early_stop: bool = EARLY_STOP,
+                 breaker: Optional[CircuitBreaker] = None,
+                 timeouts: Optional[Timeouts] = None,
+                 history: Optional[GenerationHistory] = None,
+                 history_source: str = "api",
+                 semantic_cache: Optional[SemanticCache] = None):
+        # Pooled keep-alive session used for all Ollama traffic
+        self.session = _create_session(pool_size, retries)
+
+        # One or more Ollama hosts (OLLAMA_HOST may be comma-separated)
+        self.pool = BackendPool(ollama_host or os.getenv("OLLAMA_HOST", "http://localhost:11434"),
+                                self.session)
+        self.num_parallel = max(1, num_parallel)
+
+        # Fail fast while Ollama keeps failing or timing out (OLLAMA_BREAKER_* settings)
+        self.breaker = breaker or CircuitBreaker.from_env()
+
+        # Default connect/first-token/total limits for generations (per-call timeouts override)
+        self.timeouts = timeouts or Timeouts()
+
+        # Opt-in cache of generation results (PROMPT_CACHE_PATH enables it from the environment)
+        self.response_cache = response_cache if response_cache is not None else ResponseCache.from_env()
+
+        # Opt-in reuse of prompts for requests that mean the same (PROMPT_SEMANTIC_CACHE enables it)
+        self.semantic_cache = semantic_cache if semantic_cache is not None else SemanticCache.from_env()
+        self._embed_error = None
+
+        # Searchable log of every result (PROMPT_HISTORY_* settings; an empty path disables it),
+        # with history_source naming the caller ("web", "cli", ...) in each record
+        self.history = history if history is not None else GenerationHistory.from_env()
+        self.history_source = history_source
+
+        # Downscale/re-encode images before vision calls (PROMPT_IMAGE_* settings)
+        self.image_preprocessor = image_preprocessor or ImagePreprocessor.from_env()
+
+        # Identical generations in flight at the same time share one upstream request
+        self.coalesce = coalesce
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}
+
+        # Ollama timing/usage and client latency per model, target and mode
+        self.metrics = metrics or GenerationMetrics()
+
+        # Close streams as soon as the prompt is long enough (per-call early_stop overrides)
+        self.early_stop = early_stop
+
+        # Refinement sessions that reuse Ollama's context between turns (PROMPT_SESSION_* settings)
+        self.sessions = sessions or SessionStore.from_env()
+
+        # How long Ollama keeps each model loaded, and the optional keep-warm pinger
+        self.keep_alive = keep_alive_config(keep_alive)
+        self._keep_warm_stop = None
+
+        # Model catalog cache (shared by list_models and check_ollama_connection)
+        self.model_cache_ttl = MODEL_CACHE_TTL if model_cache_ttl is None else model_cache_ttl
+        self._models_lock = threading.Lock()
+        self._models = None
+        self._models_connected = False
+        self._models_fetched_at = 0.0
+        self._models_generation = 0
+        self._models_inflight = None
+
+        # Default models are detected on first use, or ahead of it by
+        # start_model_resolver(), so building a generator never waits on Ollama
+        self._text_model = None    # Set explicitly, overriding detection
+        self._vision_model = None
+        self._detected_models = None
+        self._models_state = MODELS_PENDING
+        self._models_resolved_at = 0.0
+        self._resolve_lock = threading.Lock()
+        self._resolve_count = 0
+        self._resolver_stop = None
+
+    @property
+    def text_model(self) -> str:
+        """Default text model: the best installed one, detected on first use unless set"""
+        return self._text_model or self._default_models()[0]
+
+    @text_model.setter
+    def text_model(self, model: Optional[str]):
+        self._text_model = model
+
+    @property
+    def vision_model(self) -> str:
+        """Default vision model: the best installed one, detected on first use unless set"""
+        return self._vision_model or self._default_models()[1]
+
+    @vision_model.setter
+    def vision_model(self, model: Optional[str]):
+        self._vision_model = model
+
+    @property
+    def ollama_host(self) -> str:
+        """The Ollama host, or a comma-separated list when several are pooled"""
+        return ",".join(self.pool.hosts)
+
+    def close(self):
+        """Close pooled connections and the response caches"""
+        self.stop_model_resolver()
+        self.stop_keep_warm()
+        self.pool.close()
+        self.session.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.semantic_cache is not None:
+            self.semantic_cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _default_models(self) -> tuple:
+        """(text, vision) defaults, detecting them now if not done yet.
+
+        A stale fallback is retried here only without a background resolver
+        (start_model_resolver); with one, callers never wait on Ollama for it.
+        """
+        detected = self._detected_models
+        if detected is None or (self._models_state == MODELS_FALLBACK and self._resolver_stop is None and
+                                time.monotonic() - self._models_resolved_at >= MODEL_CACHE_ERROR_TTL):
+            detected = self.resolve_models()
+        return detected
+
+    def resolve_models(self, refresh: bool = False) -> tuple:
+        """Pick the default text and vision models from the installed ones and return them.
+
+        Concurrent callers share one detection; refresh=True always runs
+        its own and queries /api/tags even if the model list is cached.
+        When no model list can be fetched, built-in names are used and
+        the state is "fallback" until a later detection succeeds.
+        """
+        attempt = self._resolve_count
+        with self._resolve_lock:
+            if not refresh and self._resolve_count != attempt and self._detected_models is not None:
+                # Someone else detected the models while we waited
+                return self._detected_models
+            if self._detected_models is None:
+                self._models_state = MODELS_RESOLVING
+
+            host = self.ollama_host
+            models, connected = self._get_model_catalog(refresh=refresh)
+            detected = (self._find_best_text_model(models), self._find_best_vision_model(models))
+            state = MODELS_RESOLVED if connected and models else MODELS_FALLBACK
+
+            if state == MODELS_FALLBACK and self._models_state != MODELS_FALLBACK:
+                print(f"⚠️  No models listed by Ollama at {host}; using {detected[0]} and "
+                      f"{detected[1]} until they can be detected")
+            elif state == MODELS_RESOLVED and detected != self._detected_models:
+                print(f"✓ Default models: {detected[0]} (text), {detected[1]} (vision)")
+
+            self._detected_models = detected
+            self._models_state = state
+            self._models_resolved_at = time.monotonic()
+            self._resolve_count += 1
+            return detected
+
+    def model_status(self) -> dict:
+        """Default model detection state and result, without waiting on Ollama.
+
+        'connected' and 'models' are as of the last model list fetch.
+        """
+        detected = self._detected_models or (None, None)
+        age = time.monotonic() - self._models_resolved_at if self._detected_models else None
+        with self._models_lock:
+            models, connected = list(self._models or []), self._models_connected
+        return {
+            'state': self._models_state,
+            'text_model': self._text_model or detected[0],
+            'vision_model': self._vision_model or detected[1],
+            'age_seconds': round(age, 1) if age is not None else None,
+            'connected': connected,
+            'models': models
+        }
+
+    def start_model_resolver(self, interval: float = MODEL_REFRESH_INTERVAL):
+        """Detect the default models on a background thread now and every interval seconds after.
+
+        Retries every few seconds while detection falls back. interval <= 0
+        stops after the first successful detection.
+        """
+        if self._resolver_stop is not None:
+            return
+        stop = self._resolver_stop = threading.Event()
+
+        def resolve():
+            refresh = False
+            while not stop.is_set():
+                try:
+                    self.resolve_models(refresh=refresh)
+                except Exception as e:
+                    print(f"Warning: Could not detect default models: {e}")
+                refresh = True
+                if self._models_state == MODELS_RESOLVED:
+                    if interval <= 0:
+                        return
+                    delay = interval
+                else:
+                    delay = MODEL_CACHE_ERROR_TTL
+                if stop.wait(delay):
+                    return
+
+        threading.Thread(target=resolve, name="ollama-model-resolver", daemon=True).start()
+
+    def stop_model_resolver(self):
+        """Stop the background detection started by start_model_resolver()"""
+        if self._resolver_stop is not None:
+            self._resolver_stop.set()
+            self._resolver_stop = None
+
+    def check_ollama_connection(self) -> bool:
+        """Check if Ollama is running (based on the last model list refresh)"""
+        return self._get_model_catalog()[1]
+
+    def invalidate_model_cache(self):
+        """Drop the cached model list so the next caller fetches a fresh one"""
+        with self._models_lock:
+            self._models = None
+            self._models_fetched_at = 0.0
+            self._models_generation += 1
+            self._models_inflight = None
+
+    def _get_model_catalog(self, refresh: bool = False) -> tuple:
+        """Return (model names, any backend reachable), refreshing the cache once if stale.
+
+        Concurrent callers that find the cache stale share a single
+        in-flight /api/tags request instead of each issuing their own.
+        Both values come from the same fetch, even if another thread
+        invalidates or refreshes the cache meanwhile.
+        """
+        with self._models_lock:
+            if self._models is not None and not refresh:
+                ttl = self.model_cache_ttl if self._models_connected else min(
+                    self.model_cache_ttl, MODEL_CACHE_ERROR_TTL)
+                if time.monotonic() - self._models_fetched_at < ttl:
+                    return list(self._models), self._models_connected
+
+            fetch = self._models_inflight
+            leader = fetch is None
+            if leader:
+                fetch = self._models_inflight = _SharedCall()
+                generation = self._models_generation
+
+        if not leader:
+            models, connected = fetch.wait()
+            return list(models), connected
+
         try:
-            # Generate subject prompt
-            print(f"🎬 Analyzing subject...")
-            subject_response = requests.post(
-                f"{self.ollama_host}/api/generate",
-                json=subject_payload,
-                timeout=120
-            )
+            fetch.result = self._fetch_models()
+        finally:
+            with self._models_lock:
+                # Only publish if nobody invalidated the cache meanwhile
+                if generation == self._models_generation:
+                    self._models, self._models_connected = fetch.result
+                    self._models_fetched_at = time.monotonic()
+                    self._models_inflight = None
+            fetch.done.set()
+
+        models, connected = fetch.result
+        return list(models), connected
+
+    def _fetch_models(self) -> tuple:
+        """Query /api/tags on every backend, returning (model names, any reachable)"""
+        backends = self.pool.backends
+        if len(backends) == 1:
+            outcomes = [self._fetch_backend_models(backends[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(backends)) as executor:
+                outcomes = list(executor.map(self._fetch_backend_models, backends))
 
-            subject_result = ""
-            if subject_response.status_code == 200:
-                subject_result = subject_response.json().get('response', '').strip()
+        models = []
+        for names in outcomes:
+            models.extend(name for name in names or [] if name not in models)
+        return models, any(names is not None for names in outcomes)
 
-            # Generate background prompt
-            print(f"🌄 Analyzing background...")
-            background_response = requests.post(
-                f"{self.ollama_host}/api/generate",
-                json=background_payload,
-                timeout=120
-            )
+    def _fetch_backend_models(self, backend) -> Optional[list]:
+        """Query one backend's /api/tags, returning None if it is unreachable"""
+        try:
+            return self.pool.fetch_models(backend)
+        except requests.exceptions.RequestException as e:
+            print(f"Warning: Could not list models on {backend.host}: {e}")
+        except Exception as e:
+            print(f"Warning: Unexpected error listing models on {backend.host}: {e}")
+        return None
 
-            background_result = ""
-            if background_response.status_code == 200:
-                background_result = background_response.json().get('response', '').strip()
+    def test_ollama_connection(self) -> dict:
+        """Test Ollama connection with detailed diagnostics.
+
+        With several backends each one is tested; the connection succeeds
+        if any backend answers, and 'backends' holds the per-host results.
+        """
+        results = [self._test_backend(backend) for backend in self.pool.backends]
+        succeeded = [r for r in results if r['success']]
+
+        models = []
+        for r in succeeded:
+            models.extend(name for name in r.pop('models') if name not in models)
+        for r in results:
+            r.pop('models', None)
+
+        result = dict(succeeded[0] if succeeded else results[0])
+        result['ollama_host'] = self.ollama_host
+        result['models_count'] = len(models)
+        if len(results) > 1:
+            result['response_time_ms'] = max(r['response_time_ms'] for r in results)
+            result['backends'] = results
+
+        if succeeded:
+            # A successful probe is as good as a refresh of the model cache
+            with self._models_lock:
+                self._models = models
+                self._models_connected = True
+                self._models_fetched_at = time.monotonic()
 
-            # Combine them
-            combined_result = f"{subject_result}, {background_result}"
+        return result
 
-            return {
-                'subject': subject_result,
-                'background': background_result,
-                'combined': combined_result
-            }
+    def _test_backend(self, backend) -> dict:
+        """Test one backend, recording its health in the pool"""
+        host = backend.host
+        result = {
+            'success': False,
+            'ollama_host': host,
+            'error': None,
+            'error_type': None,
+            'models_count': 0,
+            'response_time_ms': 0,
+            'models': []
+        }
 
+        start_time = time.time()
+
+        try:
+            models = self.pool.fetch_models(backend)
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['success'] = True
+            result['models_count'] = len(models)
+            result['models'] = models
+
+        except requests.exceptions.HTTPError as e:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = f"{e}: {e.response.text[:200]}"
+            result['error_type'] = 'http_error'
+        except requests.exceptions.ConnectionError as e:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = f"Connection refused - Ollama may not be running at {host}"
+            result['error_type'] = 'connection_refused'
+        except requests.exceptions.Timeout:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = f"Connection timed out after 10 seconds"
+            result['error_type'] = 'timeout'
+        except requests.exceptions.InvalidURL:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = f"Invalid URL: {host}"
+            result['error_type'] = 'invalid_url'
         except Exception as e:
+            result['response_time_ms'] = int((time.time() - start_time) * 1000)
+            result['error'] = str(e)
+            result['error_type'] = 'unknown'
+
+        return result
+
+    def set_ollama_host(self, host: Union[str, Iterable[str]]) -> dict:
+        """Update Ollama host (or comma-separated hosts) and re-detect models"""
+        if not parse_hosts(host):
+            return {'success': False, 'error': "No Ollama host given", 'error_type': 'invalid_url'}
+
+        old_pool = self.pool
+        self.pool = BackendPool(host, self.session)
+        self.invalidate_model_cache()
+
+        # Test the new connection
+        test_result = self.test_ollama_connection()
+
+        if test_result['success']:
+            old_pool.close()
+            self.breaker.reset()
+            # Re-detect models with new host
+            self.text_model = None
+            self.vision_model = None
+            self.resolve_models(refresh=True)
             return {
-                'subject': f"Error: {str(e)}",
-                'background': f"Error: {str(e)}",
-                'combined': f"Error: {str(e)}"
+                'success': True,
+                'ollama_host': self.ollama_host,
+                'text_model': self.text_model,
+                'vision_model': self.vision_model,
+                'models_count': test_result['models_count']
+            }
+        else:
+            # Revert to old host on failure
+            self.pool.close()
+            self.pool = old_pool
+            self.invalidate_model_cache()
+            return {
+                'success': False,
+                'error': test_result['error'],
+                'error_type': test_result['error_type']
             }
 
+    def list_models(self, refresh: bool = False) -> list:
+        """List available Ollama models (cached for model_cache_ttl seconds)"""
+        return self._get_model_catalog(refresh=refresh)[0]
+
+    def warm_up(self, models: Optional[Iterable[str]] = None, wait: bool = True) -> Optional[dict]:
+        """Load models into memory ahead of the first request.
+
+        Defaults to text_model and vision_model, and loads each on every
+        healthy backend that has it, sending the configured keep_alive.
+        Returns {model: loaded everywhere} when wait is True; otherwise
+        the loads run on a background thread and None is returned.
+        """
+        if not wait:
+            threading.Thread(target=self.warm_up, args=(models,), name="ollama-warm-up",
+                             daemon=True).start()
+            return None
+
+        results = self._load_models(models)
+        for model, error in results.items():
+            if error is None:
+                print(f"🔥 Warmed up {model}")
+            else:
+                print(f"Warning: Could not warm up {model}: {error}")
+        return {model: error is None for model, error in results.items()}
+
+    def _load_models(self, models: Optional[Iterable[str]] = None) -> dict:
+        """Send an empty generate (which only loads the model) per model and backend.
+
+        Returns {model: None, or the last error}.
+        """
+        if models is None:
+            models = [self.text_model, self.vision_model]
+        models = list(dict.fromkeys(models))
+
+        jobs = [(model, backend) for model in models for backend in self.pool.serving(model)]
+        results = {model: None for model in models}
+        if not jobs:
+            return results
+
+        def load(job):
+            model, backend = job
+            payload = self._with_keep_alive({"model": model, "stream": False})
+            try:
+                response = self.session.post(f"{backend.host}/api/generate", json=payload,
+                                             timeout=(self.timeouts.connect, WARM_UP_TIMEOUT))
+                if response.status_code != 200:
+                    raise OllamaError(f"Error: {response.status_code} - {response.text}")
+            except Exception as e:
+                return model, f"{backend.host}: {e}"
+            return model, None
+
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            for model, error in executor.map(load, jobs):
+                if error is not None:
+                    results[model] = error
+        return results
+
+    def start_keep_warm(self, interval: float = KEEP_WARM_INTERVAL):
+        """Reload text_model and vision_model every interval seconds so they stay in memory.
+
+        Useful when the server unloads idle models regardless of keep_alive
+        (or another client's requests evict them). interval <= 0 does nothing.
+        """
+        if interval <= 0 or self._keep_warm_stop is not None:
+            return
+        stop = self._keep_warm_stop = threading.Event()
+
+        def ping():
+            while not stop.wait(interval):
+                for model, error in self._load_models().items():
+                    if error is not None:
+                        print(f"Warning: Keep-warm ping for {model} failed: {error}")
+
+        threading.Thread(target=ping, name="ollama-keep-warm", daemon=True).start()
+
+    def stop_keep_warm(self):
+        """Stop the keep-warm pinger started by start_keep_warm()"""
+        if self._keep_warm_stop is not None:
+            self._keep_warm_stop.set()
+            self._keep_warm_stop = None
+
+    def generate_prompt(self,
+                       user_input: str,
+                       prompt_type: str = "image",
+                       image_path: Optional[ImageSource] = None,
+                       model_override: Optional[str] = None,
+                       word_limit: int = 50,
+                       target_model: str = "stable-diffusion",
+                       use_cache: bool = True,
+                       coalesce: Optional[bool] = None,
+                       early_stop: Optional[bool] = None,
+                       timeouts: Optional[Timeouts] = None,
+                       cancel: Optional[threading.Event] = None,
+                       record: Union[dict, bool, None] = None) -> str:
+        """Generate uncensored prompt using Ollama with target model optimization.
+
+        Pass use_cache=False to skip the response cache, and coalesce=False
+        to not share an identical in-flight request, for an independent sample.
+        With early_stop (default: self.early_stop) the generation is streamed
+        and cut off once the target's keyword/word budget is met. timeouts
+        overrides self.timeouts, and setting cancel (anything with an
+        is_set() method, such as a threading.Event) abandons the upstream
+        request at the next token. Successful results are added to
+        self.history along with the fields in record (such as {'seed': ...}),
+        unless record is False. With a semantic cache in "return" mode, a
+        text request close enough to an earlier one (see find_similar)
+        gets that request's prompt back unless use_cache is False.
+        Errors are returned as the prompt text; see _generate for a version
+        that raises them.
+        """
+        try:
+            return self._generate(user_input, prompt_type, image_path, model_override, word_limit, target_model,
+                                  use_cache=use_cache, coalesce=coalesce, early_stop=early_stop,
+                                  timeouts=timeouts, cancel=cancel, record=record)
+        except OllamaError as e:
+            return str(e)
+        except Exception as e:
+            return f"Error generating prompt: {str(e)}"
+
+    def _generate(self,
+                  user_input: str,
+                  prompt_type: str = "image",
+                  image_path: Optional[ImageSource] = None,
+                  model_override: Optional[str] = None,
+                  word_limit: int = 50,
+                  target_model: str = "stable-diffusion",
+                  use_cache: bool = True,
+                  coalesce: Optional[bool] = None,
+                  early_stop: Optional[bool] = None,
+                  timeouts: Optional[Timeouts] = None,
+                  cancel: Optional[threading.Event] = None,
+                  record: Union[dict, bool, None] = None) -> str:
+        """generate_prompt, raising errors instead of returning them as the prompt"""
+        if self.early_stop if early_stop is None else early_stop:
+            tokens = self.generate_prompt_stream(
+                user_input, prompt_type, image_path, model_override, word_limit, target_model,
+                use_cache=use_cache, coalesce=coalesce, early_stop=True, timeouts=timeouts, record=record
+            )
+            return ''.join(self._until_cancelled(tokens, cancel)).strip()
+
+        started = time.perf_counter()
+        payload = self._build_generate_payload(
+            user_input, prompt_type, self.encode_image(image_path) if image_path else None,
+            model_override, word_limit, target_model, stream=False
+        )
+        labels = self._metric_labels(payload, prompt_type, target_model, "image" if image_path else "standard")
+
+        # An exact repeat is answered from the response cache without embedding anything
+        result = self._cache_lookup(payload, labels, use_cache)[1]
+        if result is None:
+            semantic, match = self._semantic_match(user_input, image_path, payload, labels, word_limit, use_cache)
+            if match is not None:
+                self._record_history(record, labels, user_input, match['response'], started,
+                                     extra={'similar_to': match['input']})
+                return match['response']
+
+            # Send request to Ollama (the response cache was already checked)
+            result = self._post_generate(payload, use_cache=False, coalesce=coalesce, labels=labels,
+                                         timeouts=timeouts, cancel=cancel)
+            self._semantic_store(semantic, user_input, result['response'])
+        self._record_history(record, labels, user_input, result['response'], started, result)
+        return result['response']
+
+    def find_similar(self,
+                     user_input: str,
+                     prompt_type: str = "image",
+                     model_override: Optional[str] = None,
+                     word_limit: int = 50,
+                     target_model: str = "stable-diffusion") -> Optional[dict]:
+        """Look up an earlier text request that means the same as user_input.
+
+        Only requests with the same prompt type, target, model and word
+        limit are compared. Returns {'input', 'response', 'similarity'}
+        for the closest one at or above the semantic cache's threshold,
+        or None (also when the semantic cache is off).
+        """
+        payload = {'model': model_override or self.text_model}
+        semantic = self._semantic_key(user_input, None, payload, prompt_type, target_model, word_limit)
+        return self.semantic_cache.lookup(*semantic) if semantic else None
+
+    def _semantic_key(self,
+                      user_input: str,
+                      image_path: Optional[ImageSource],
+                      payload: dict,
+                      prompt_type: str,
+                      target_model: str,
+                      word_limit: int) -> Optional[tuple]:
+        """(bucket, embedding) of a text request when the semantic cache is on, else None"""
+        if self.semantic_cache is None or image_path is not None or not user_input.strip():
+            return None
+        vector = self._embed(user_input.strip())
+        if vector is None:
+            return None
+        return self.semantic_cache.bucket_key(prompt_type, target_model, payload['model'], word_limit), vector
+
+    def _semantic_match(self,
+                        user_input: str,
+                        image_path: Optional[ImageSource],
+                        payload: dict,
+                        labels: dict,
+                        word_limit: int,
+                        use_cache: bool) -> tuple:
+        """(semantic key to store the result under, stored match to answer with) for a request"""
+        semantic = self._semantic_key(user_input, image_path, payload, labels['prompt_type'],
+                                      labels['target_model'], word_limit)
+        if semantic is None or not use_cache or self.semantic_cache.mode != RETURN:
+            return semantic, None
+        match = self.semantic_cache.lookup(*semantic)
+        if match is not None:
+            self.metrics.count(labels, "semantic")
+        return semantic, match
+
+    def _semantic_store(self, semantic: Optional[tuple], user_input: str, response: str):
+        if semantic is not None and response:
+            self.semantic_cache.add(*semantic, user_input.strip(), response)
+
+    def _embed(self, text: str):
+        """Unit embedding of text from the semantic cache's model, or None if Ollama cannot provide it"""
+        vector = self.semantic_cache.embedding(text)
+        if vector is not None or not self.breaker.available():
+            return vector
+
+        model = self.semantic_cache.model
+        backend = self.pool.acquire(model)
+        error = None
+        try:
+            response = self.session.post(
+                f"{backend.host}/api/embed",
+                json=self._with_keep_alive({"model": model, "input": text}),
+                timeout=self.timeouts.requests_timeout()
+            )
+            if response.status_code != 200:
+                raise OllamaError(f"Error: {response.status_code} - {response.text}")
+            vector = self.semantic_cache.remember_embedding(text, response.json()['embeddings'][0])
+            self._embed_error = None
+            return vector
+        except Exception as e:
+            if isinstance(e, requests.exceptions.RequestException):
+                error = e
+            # Generation goes ahead without the cache; only warn when the problem changes
+            if str(e) != self._embed_error:
+                self._embed_error = str(e)
+                print(f"Warning: Semantic cache skipped, could not embed with {model}: {e}")
+            return None
+        finally:
+            self.pool.release(backend, error)
+
+    def _record_history(self,
+                        record: Union[dict, bool, None],
+                        labels: dict,
+                        user_input: str,
+                        output: str,
+                        started: float,
+                        result: Optional[dict] = None,
+                        first_token: Optional[float] = None,
+                        extra: Optional[dict] = None):
+        """Add a finished generation to self.history (record holds extra fields, or is False to skip)"""
+        if self.history is None or record is False or not output:
+            return
+        timings = {'wall_ms': round((time.perf_counter() - started) * 1000)}
+        if first_token is not None:
+            timings['first_token_ms'] = round((first_token - started) * 1000)
+        for field in ('total', 'load', 'prompt_eval', 'eval'):
+            if result and result.get(f"{field}_duration"):
+                timings[f"{field}_ms"] = round(result[f"{field}_duration"] / 1e6)
+        for field in ('prompt_eval_count', 'eval_count'):
+            if result and result.get(field):
+                timings[field] = result[field]
+
+        fields = dict(extra or {}, **(record or {}))
+        try:
+            self.history.add(
+                user_input, output,
+                source=fields.pop('source', self.history_source),
+                mode=labels['mode'],
+                prompt_type=labels['prompt_type'],
+                target_model=labels['target_model'],
+                model=labels['model'],
+                seed=fields.pop('seed', None),
+                timings=timings,
+                extra=fields
+            )
+        except sqlite3.Error as e:
+            print(f"⚠️  Could not record generation history: {e}")
+
+    def _recorded(self,
+                  tokens: Iterator[str],
+                  record: Union[dict, bool, None],
+                  labels: dict,
+                  user_input: str,
+                  extra: Optional[dict] = None) -> Iterator[str]:
+        """Pass a stream through, adding its text to the history once it completes"""
+        started = time.perf_counter()
+        first_token = None
+        text = []
+        for token in tokens:
+            if first_token is None:
+                first_token = time.perf_counter()
+            text.append(token)
+            yield token
+        self._record_history(record, labels, user_input, ''.join(text).strip(), started,
+                             first_token=first_token, extra=extra)
+
+    def _cache_lookup(self, payload: dict, labels: dict, use_cache: bool = True) -> tuple:
+        """(response cache key, cached result) for a payload; both None without a response cache.
+
+        The result is also None on a miss or when use_cache is False. A hit
+        is counted in self.metrics.
+        """
+        if self.response_cache is None:
+            return None, None
+        cache_key = payload_key(payload)
+        cached = self.response_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            self.metrics.count(labels, "cached")
+        return cache_key, cached
+
+    @staticmethod
+    def _cached_tokens(cached: dict, budget: Optional[OutputBudget] = None) -> Iterator[str]:
+        """A cached result as a stream of one token, trimmed to the budget"""
+        response = budget.apply(cached['response']) if budget else cached['response']
+        if response:
+            yield response
+
+    def _post_generate(self,
+                       payload: dict,
+                       timeouts: Optional[Timeouts] = None,
+                       use_cache: bool = True,
+                       coalesce: Optional[bool] = None,
+                       labels: Optional[dict] = None,
+                       cancel: Optional[threading.Event] = None) -> dict:
+        """Run a /api/generate request to completion and return the final result.
+
+        The 'response' text is stripped. Raises OllamaError on an HTTP
+        error status; request exceptions propagate. Results go through the
+        response cache when one is configured; use_cache=False skips the
+        lookup but still stores the fresh result. Unless coalesce is False
+        (default: self.coalesce), a call identical to one already in
+        flight waits for and shares that call's result. Setting cancel
+        only stops that caller's wait; the upstream request is closed
+        once every caller sharing it has cancelled. The outcome and
+        Ollama's timings are recorded in self.metrics under labels.
+        """
+        labels = labels or {'model': payload.get('model')}
+        cache_key, cached = self._cache_lookup(payload, labels, use_cache)
+        if cached is not None:
+            return cached
+
+        if not (self.coalesce if coalesce is None else coalesce):
+            return self._send_generate(payload, timeouts, cache_key, labels, cancel)
+
+        # Join an identical call already in flight, or start one on its own
+        # thread so each caller, the first included, can give up separately
+        key = cache_key or payload_key(payload)
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            leader = call is None or not call.join()
+            if leader:
+                call = self._inflight[key] = _SharedCall()
+                call.join()
+
+        if leader:
+            threading.Thread(
+                target=self._run_shared_call,
+                args=(key, call, payload, timeouts, cache_key, labels),
+                daemon=True
+            ).start()
+        else:
+            self.metrics.count(labels, "coalesced")
+
+        try:
+            return dict(call.wait(cancel))
+        finally:
+            call.leave()
+
+    def _run_shared_call(self,
+                         key: str,
+                         call: _SharedCall,
+                         payload: dict,
+                         timeouts: Optional[Timeouts],
+                         cache_key: Optional[str],
+                         labels: dict):
+        """Run a coalesced request, closing it early once every caller waiting on it has left"""
+        try:
+            call.result = self._send_generate(payload, timeouts, cache_key, labels, cancel=call)
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._inflight_lock:
+                if self._inflight.get(key) is call:
+                    del self._inflight[key]
+            call.done.set()
+
+    def _allow_request(self):
+        """Raise CircuitOpenError instead of sending a generation while the circuit is open"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.status())
+
+    def _record_response(self, error: Optional[Exception], status_code: Optional[int] = None):
+        """Report a generation's outcome to the circuit breaker: transport errors and 5xx answers count against it"""
+        if error is None and status_code is not None and status_code >= 500:
+            error = OllamaError(f"HTTP {status_code}")
+        if error is None:
+            self.breaker.success()
+        else:
+            self.breaker.failure(error)
+
+    @contextmanager
+    def _generate_request(self, payload: dict, timeouts: Timeouts, stream: bool = False):
+        """POST /api/generate to the least-loaded backend serving the model.
+
+        A backend that cannot be reached is ejected and the request moves
+        on to the next healthy one; errors after the request was delivered
+        eject the backend but are not retried. Yields the open response.
+        Raises CircuitOpenError without sending anything while the circuit
+        breaker is open.
+        """
+        self._allow_request()
+        model = payload.get('model')
+        tried = []
+        while True:
+            backend = self.pool.acquire(model, exclude=tried)
+            try:
+                response = self.session.post(
+                    f"{backend.host}/api/generate",
+                    json=self._with_keep_alive(payload),
+                    timeout=timeouts.requests_timeout(),
+                    stream=stream
+                )
+            except requests.exceptions.RequestException as e:
+                self.pool.release(backend, e)
+                tried.append(backend.host)
+                if isinstance(e, requests.exceptions.ConnectionError) and self.pool.has_alternative(model, tried):
+                    continue
+                self._record_response(e)
+                raise
+            break
+
+        error = None
+        try:
+            with response:
+                yield response
+        except (requests.exceptions.RequestException, GenerationTimeout) as e:
+            error = e
+            raise
+        finally:
+            # A slow generation counts against the circuit but does not eject the backend
+            self.pool.release(backend, error if not isinstance(error, GenerationTimeout) else None)
+            self._record_response(error, response.status_code)
+
+    def _send_generate(self,
+                       payload: dict,
+                       timeouts: Optional[Timeouts],
+                       cache_key: Optional[str],
+                       labels: dict,
+                       cancel: Optional[threading.Event] = None) -> dict:
+        """Run one request to completion, storing the result under cache_key.
+
+        The request is streamed from Ollama even though the caller wants
+        the whole result, so the first-token and total timeouts and
+        cancellation can stop it part-way.
+        """
+        result = {}
+        for _ in self._stream_generate(dict(payload, stream=True), cache_key, labels,
+                                       on_done=result.update, timeouts=timeouts, cancel=cancel):
+            pass
+        if not result:
+            self.metrics.count(labels, "error")
+            raise OllamaError("Error: Ollama closed the connection before the generation finished")
+        return result
+
+    def generate_many(self,
+                      items: Iterable[Union[str, dict]],
+                      concurrency: Optional[int] = None,
+                      progress: Optional[Callable[[int, Optional[int]], None]] = None) -> list:
+        """Generate prompts for many requests concurrently, in input order.
+
+        See iter_generate_many for the arguments and result format.
+        """
+        results = list(self.iter_generate_many(items, concurrency=concurrency, progress=progress))
+        results.sort(key=lambda result: result['index'])
+        return results
+
+    def iter_generate_many(self,
+                           items: Iterable[Union[str, dict]],
+                           concurrency: Optional[int] = None,
+                           progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Iterator[dict]:
+        """Generate prompts concurrently, yielding results as they complete.
+
+        Each item is a prompt string or a dict of generate_prompt keyword
+        arguments (with 'user_input' required). At most `concurrency`
+        requests (default: num_parallel) are in flight, and items are
+        pulled lazily so large iterables are never fully materialised.
+        A failing item does not abort the batch; each result is a dict
+        with 'index', 'request', 'result' and 'error' (None on success).
+        progress(done, total) is called after every item; total is None
+        when the input has no length.
+        """
+        concurrency = max(1, concurrency or self.num_parallel)
+        total = len(items) if hasattr(items, '__len__') else None
+        pending = {}
+        done_count = 0
+        source = enumerate(items)
+
+        def submit_next(executor) -> bool:
+            try:
+                index, item = next(source)
+            except StopIteration:
+                return False
+            request = {'user_input': item} if isinstance(item, str) else dict(item)
+            pending[executor.submit(self._generate, **request)] = (index, request)
+            return True
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while len(pending) < concurrency and submit_next(executor):
+                pass
+
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index, request = pending.pop(future)
+                    try:
+                        result, error = future.result(), None
+                    except Exception as e:
+                        result, error = None, self._format_error(e)
+
+                    done_count += 1
+                    if progress:
+                        progress(done_count, total)
+                    yield {'index': index, 'request': request, 'result': result, 'error': error}
+
+                    submit_next(executor)
+
+    def generate_prompt_stream(self,
+                               user_input: str,
+                               prompt_type: str = "image",
+                               image_path: Optional[ImageSource] = None,
+                               model_override: Optional[str] = None,
+                               word_limit: int = 50,
+                               target_model: str = "stable-diffusion",
+                               use_cache: bool = True,
+                               coalesce: Optional[bool] = None,
+                               early_stop: Optional[bool] = None,
+                               timeouts: Optional[Timeouts] = None,
+                               record: Union[dict, bool, None] = None) -> Iterator[str]:
+        """Generate a prompt like generate_prompt, yielding tokens as Ollama produces them.
+
+        Raises OllamaError if Ollama returns an error and lets request
+        exceptions propagate. Closing the iterator early closes the
+        upstream connection once no other coalesced reader remains. A
+        response cache hit is yielded as one token. With early_stop
+        (default: self.early_stop), text is released in whole keywords or
+        sentences and the upstream request is closed as soon as the
+        target's keyword/word budget is met. timeouts overrides
+        self.timeouts; running past the total raises GenerationTimeout.
+        A stream read to the end is added to self.history, and a semantic
+        cache match is yielded as one token, as in generate_prompt.
+        """
+
+        payload = self._build_generate_payload(
+            user_input, prompt_type, self.encode_image(image_path) if image_path else None,
+            model_override, word_limit, target_model, stream=True
+        )
+        labels = self._metric_labels(payload, prompt_type, target_model, "image" if image_path else "standard")
+        budget = None
+        if self.early_stop if early_stop is None else early_stop:
+            budget = self._output_budget(prompt_type, target_model, word_limit)
+
+        # An exact repeat is answered from the response cache without embedding anything
+        cached = self._cache_lookup(payload, labels, use_cache)[1]
+        if cached is not None:
+            yield from self._recorded(self._cached_tokens(cached, budget), record, labels, user_input)
+            return
+        semantic, match = self._semantic_match(user_input, image_path, payload, labels, word_limit, use_cache)
+        if match is not None:
+            yield from self._recorded(iter([match['response']]), record, labels, user_input,
+                                      extra={'similar_to': match['input']})
+            return
+
+        text = []
+        tokens = self._stream_payload(payload, labels, False, coalesce, budget, timeouts)
+        for token in self._recorded(tokens, record, labels, user_input):
+            text.append(token)
+            yield token
+        self._semantic_store(semantic, user_input, ''.join(text).strip())
+
+    def _stream_payload(self,
+                        payload: dict,
+                        labels: dict,
+                        use_cache: bool = True,
+                        coalesce: Optional[bool] = None,
+                        budget: Optional[OutputBudget] = None,
+                        timeouts: Optional[Timeouts] = None) -> Iterator[str]:
+        """Stream a built payload through the response cache and coalescing"""
+        cache_key, cached = self._cache_lookup(payload, labels, use_cache)
+        if cached is not None:
+            yield from self._cached_tokens(cached, budget)
+            return
+
+        if not (self.coalesce if coalesce is None else coalesce):
+            yield from self._stream_generate(payload, cache_key, labels, budget=budget, timeouts=timeouts)
+            return
+
+        # Attach to an identical stream already in flight, or start one;
+        # budgeted streams end early, so they only share with the same budget
+        key = "stream:" + (cache_key or payload_key(payload)) + (f":{budget}" if budget else "")
+        with self._inflight_lock:
+            fanout = self._inflight.get(key)
+            leader = fanout is None
+            if leader:
+                fanout = self._inflight[key] = _StreamFanout()
+            fanout.join()
+
+        if leader:
+            threading.Thread(
+                target=self._pump_stream,
+                args=(key, fanout, payload, cache_key, labels, budget, timeouts),
+                daemon=True
+            ).start()
+        else:
+            self.metrics.count(labels, "coalesced")
+
+        yield from fanout.read()
+
+    def _pump_stream(self,
+                     key: str,
+                     fanout: _StreamFanout,
+                     payload: dict,
+                     cache_key: Optional[str],
+                     labels: dict,
+                     budget: Optional[OutputBudget] = None,
+                     timeouts: Optional[Timeouts] = None):
+        """Feed one upstream stream into a fanout until it ends or every reader has left"""
+        error = None
+        try:
+            for token in self._stream_generate(payload, cache_key, labels, budget=budget, timeouts=timeouts):
+                fanout.publish(token)
+                if fanout.subscribers == 0:
+                    break
+        except Exception as e:
+            error = e
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            fanout.finish(error)
+
+    def _stream_generate(self,
+                         payload: dict,
+                         cache_key: Optional[str],
+                         labels: dict,
+                         on_done: Optional[Callable[[dict], None]] = None,
+                         budget: Optional[OutputBudget] = None,
+                         timeouts: Optional[Timeouts] = None,
+                         cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        """Stream one request from Ollama, storing the full result under cache_key when it completes.
+
+        on_done receives the final chunk, with 'response' set to the full text.
+        With a budget, tokens pass through it and the request is closed once
+        the budget is reached; that trimmed result is not cached, and its
+        final chunk has done_reason 'budget' and only the client-side counts.
+        The request is closed with GenerationTimeout once it runs past the
+        total timeout, and with GenerationCancelled once cancel is set.
+        """
+        timeouts = timeouts or self.timeouts
+        tokens = []
+        sent_at = time.monotonic()
+        deadline = sent_at + timeouts.total if timeouts.total else None
+        first_token = None
+
+        try:
+            with self._generate_request(payload, timeouts, stream=True) as response:
+                if response.status_code != 200:
+                    raise OllamaError(f"Error: {response.status_code} - {response.text}")
+
+                started = False
+                for line in response.iter_lines():
+                    # Leaving the with block closes the connection, which stops Ollama generating
+                    if cancel is not None and cancel.is_set():
+                        raise GenerationCancelled("Error: Generation cancelled")
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise GenerationTimeout(f"Error: Generation timed out after {timeouts.total:g}s")
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise OllamaError(f"Error: {chunk['error']}")
+                    token = chunk.get('response', '')
+                    if not started:
+                        # Match generate_prompt, which strips leading whitespace
+                        token = token.lstrip()
+                    if token:
+                        if not started:
+                            first_token = time.monotonic() - sent_at
+                        started = True
+                        tokens.append(token)
+                        if budget is None:
+                            yield token
+                        else:
+                            released = budget.feed(token)
+                            if released:
+                                yield released
+                            if budget.reached:
+                                chunk = {'model': chunk.get('model', payload.get('model')), 'done': True,
+                                         'done_reason': 'budget', 'eval_count': len(tokens)}
+                                self.metrics.record(labels, chunk, time.monotonic() - sent_at, first_token)
+                                chunk['response'] = budget.released.strip()
+                                if on_done is not None:
+                                    on_done(chunk)
+                                break
+                    if chunk.get('done'):
+                        if budget is not None:
+                            released = budget.finish()
+                            if released:
+                                yield released
+                        self.metrics.record(labels, chunk, time.monotonic() - sent_at, first_token)
+                        chunk['response'] = ''.join(tokens).strip()
+                        if cache_key is not None:
+                            self.response_cache.put(cache_key, chunk)
+                        if on_done is not None:
+                            on_done(chunk)
+                        break
+        except GenerationCancelled:
+            self.metrics.count(labels, "cancelled")
+            raise
+        except Exception:
+            self.metrics.count(labels, "error")
+            raise
+
+    @staticmethod
+    def _until_cancelled(tokens: Iterator[str], cancel: Optional[threading.Event]) -> Iterator[str]:
+        """Pass tokens through, closing the stream (and its upstream request) once cancel is set"""
+        if cancel is None:
+            yield from tokens
+            return
+        try:
+            for token in tokens:
+                if cancel.is_set():
+                    raise GenerationCancelled("Error: Generation cancelled")
+                yield token
+        finally:
+            tokens.close()
+
+    def enhance_prompt(self,
+                       base_prompt: str,
+                       style: Optional[str] = None,
+                       session: Optional[PromptSession] = None) -> str:
+        """Enhance an existing prompt with additional details.
+
+        With a session, the enhancement is a refinement turn: repeated
+        enhancements of the session's latest prompt reuse its context.
+        """
+        if session is not None:
+            if session.last_prompt != base_prompt.strip():
+                session.last_prompt = base_prompt.strip()
+                session.context = None
+            instruction = "more vivid details"
+            if style:
+                instruction += f" in {style} style"
+            return self.refine_prompt(session, instruction)
+
+        enhancement_request = f"Enhance this prompt with more vivid details"
+        if style:
+            enhancement_request += f" in {style} style"
+        enhancement_request += f": {base_prompt}"
+
+        return self.generate_prompt(enhancement_request)
+
+    def start_session(self,
+                      prompt_type: str = "image",
+                      target_model: str = "stable-diffusion",
+                      word_limit: int = 50,
+                      model_override: Optional[str] = None,
+                      last_prompt: Optional[str] = None) -> PromptSession:
+        """Start a refinement session (kept in self.sessions until idle for PROMPT_SESSION_TTL).
+
+        Pass last_prompt to refine an existing prompt; otherwise the first
+        refine_prompt() call generates one.
+        """
+        return self.sessions.create(prompt_type=prompt_type, target_model=target_model,
+                                    word_limit=word_limit, model=model_override,
+                                    last_prompt=last_prompt.strip() if last_prompt else None)
+
+    def refine_prompt(self,
+                      session: PromptSession,
+                      text: str,
+                      image_path: Optional[ImageSource] = None,
+                      use_cache: bool = True,
+                      timeouts: Optional[Timeouts] = None,
+                      cancel: Optional[threading.Event] = None,
+                      record: Union[dict, bool, None] = None) -> str:
+        """Run one turn of a refinement session and return the prompt.
+
+        The first turn generates from text like generate_prompt (using
+        image_path if given). Later turns treat text as an edit, such as
+        "more dramatic lighting", and send only that plus the context
+        Ollama returned for the previous turn. Errors are returned as
+        strings and leave the session unchanged. Each turn is added to
+        self.history as in generate_prompt.
+        """
+        started = time.perf_counter()
+        with session.lock:
+            payload, labels = self._session_payload(session, text, image_path, stream=False)
+            try:
+                result = self._post_generate(payload, timeouts, use_cache=use_cache, coalesce=False, labels=labels,
+                                             cancel=cancel)
+            except OllamaError as e:
+                return str(e)
+            except Exception as e:
+                return f"Error generating prompt: {str(e)}"
+            session.update(payload['model'], result['response'], result.get('context'))
+            self._record_history(record, labels, text, result['response'], started, result,
+                                 extra={'session_id': session.id, 'turn': session.turns})
+            return result['response']
+
+    def refine_prompt_stream(self,
+                             session: PromptSession,
+                             text: str,
+                             image_path: Optional[ImageSource] = None,
+                             timeouts: Optional[Timeouts] = None,
+                             record: Union[dict, bool, None] = None) -> Iterator[str]:
+        """Stream one turn of a refinement session, like refine_prompt.
+
+        The session is updated once the stream completes; errors are raised
+        as in generate_prompt_stream. The session is only locked while its
+        state is read and updated, never while tokens are yielded, so an
+        abandoned stream cannot block later turns.
+        """
+        with session.lock:
+            payload, labels = self._session_payload(session, text, image_path, stream=True)
+            turn = session.turns + 1
+
+        def on_done(chunk: dict):
+            with session.lock:
+                session.update(payload['model'], chunk['response'], chunk.get('context'))
+
+        tokens = self._stream_generate(payload, None, labels, on_done=on_done, timeouts=timeouts)
+        yield from self._recorded(tokens, record, labels, text, extra={'session_id': session.id, 'turn': turn})
+
+    def _session_payload(self,
+                         session: PromptSession,
+                         text: str,
+                         image_path: Optional[ImageSource],
+                         stream: bool) -> tuple:
+        """Build (payload, metric labels) for a session turn"""
+        if session.last_prompt is None:
+            payload = self._build_generate_payload(
+                text, session.prompt_type, self.encode_image(image_path) if image_path else None,
+                session.model, session.word_limit, session.target_model, stream=stream
+            )
+            mode = "image" if image_path else "standard"
+        else:
+            payload = self._build_refine_payload(session, text, stream)
+            mode = "refine"
+        return payload, self._metric_labels(payload, session.prompt_type, session.target_model, mode)
 
-def interactive_mode():
+    def breakdown_image_prompt(self,
+                               user_input: str,
+                               image_path: ImageSource,
+                               prompt_type: str = "image",
+                               model_override: Optional[str] = None,
+                               word_limit: int = 50,
+                               target_model: str = "stable-diffusion",
+                               parallel: Optional[bool] = None,
+                               use_cache: bool = True,
+                               coalesce: Optional[bool] = None,
+                               timeouts: Optional[Timeouts] = None,
+                               cancel: Optional[threading.Event] = None,
+                               record: Union[dict, bool, None] = None) -> dict:
+        """Break down an image into separate subject and background prompts.
+
+        Both halves run concurrently when the backend accepts parallel
+        requests (num_parallel > 1) unless parallel is False. If only one
+        half succeeds, 'combined' holds just that half and 'partial' is True.
+        timeouts and cancel apply to each half as in generate_prompt, and
+        the combined prompt is added to self.history unless both failed.
+        """
+
+        started = time.perf_counter()
+        model = model_override or self.vision_model
+
+        # Encode once and share between both payloads
+        subject_payload, background_payload = self._build_breakdown_payloads(
+            user_input, self.encode_image(image_path), prompt_type, model, word_limit, target_model
+        )
+        labels = self._metric_labels(subject_payload, prompt_type, target_model, "breakdown")
+        options = (use_cache, coalesce, labels, timeouts, cancel)
+
+        if parallel is None:
+            parallel = self.num_parallel > 1
+
+        if parallel:
+            print(f"🎬 Analyzing subject and background...")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                subject_future = executor.submit(self._run_breakdown_part, subject_payload, *options)
+                background_future = executor.submit(self._run_breakdown_part, background_payload, *options)
+                subject_result, subject_ok = subject_future.result()
+                background_result, background_ok = background_future.result()
+        else:
+            # Generate subject prompt
+            print(f"🎬 Analyzing subject...")
+            subject_result, subject_ok = self._run_breakdown_part(subject_payload, *options)
+
+            # Generate background prompt
+            print(f"🌄 Analyzing background...")
+            background_result, background_ok = self._run_breakdown_part(background_payload, *options)
+
+        breakdown = self._combine_breakdown(subject_result, subject_ok, background_result, background_ok)
+        if subject_ok or background_ok:
+            self._record_history(record, labels, user_input, breakdown['combined'], started,
+                                 extra=self._breakdown_fields(breakdown))
+        return breakdown
+
+    @staticmethod
+    def _breakdown_fields(breakdown: dict) -> dict:
+        """The halves of a breakdown, kept alongside the combined prompt in the history"""
+        return {key: breakdown[key] for key in ('subject', 'background', 'partial')}
+
+    def _run_breakdown_part(self,
+                            payload: dict,
+                            use_cache: bool = True,
+                            coalesce: Optional[bool] = None,
+                            labels: Optional[dict] = None,
+                            timeouts: Optional[Timeouts] = None,
+                            cancel: Optional[threading.Event] = None) -> tuple:
+        """Run one half of a breakdown, returning (text, succeeded)"""
+        try:
+            result = self._post_generate(payload, timeouts, use_cache=use_cache, coalesce=coalesce, labels=labels,
+                                         cancel=cancel)
+            return result['response'], True
+        except Exception as e:
+            return self._format_error(e), False
+
+    def iter_breakdown_images(self,
+                              images: Iterable[ImageSource],
+                              user_input: str = "",
+                              prompt_type: str = "image",
+                              model_override: Optional[str] = None,
+                              word_limit: int = 50,
+                              target_model: str = "stable-diffusion",
+                              concurrency: Optional[int] = None,
+                              prepare_workers: Optional[int] = None,
+                              use_cache: bool = True,
+                              timeouts: Optional[Timeouts] = None,
+                              record: Union[dict, bool, None] = None) -> Iterator[dict]:
+        """Break down many images, yielding each result as soon as it is ready.
+
+        A pipeline of two stages that overlap: prepare_workers threads
+        (default: CPU count) read, hash and preprocess images, and at most
+        `concurrency` vision requests (default: num_parallel per backend)
+        run at once, each breakdown half as its own request. Preparation
+        runs at most 2 * concurrency images ahead of inference, so large
+        directories are never held in memory. Byte-identical images are
+        only analysed once while the first one's breakdown is among the
+        last BREAKDOWN_RESULTS_KEPT finished (after that they are analysed
+        again, mostly from the response cache). Each result is a dict with 'index', 'image',
+        'sha256', the breakdown_image_prompt keys ('subject', 'background',
+        'combined', 'partial'), 'duplicate_of' (index of the identical
+        image analysed, or None) and 'error' (None unless the image could
+        not be read). Closing the iterator early cancels in-flight requests.
+        Each analysed image is added to self.history as in
+        breakdown_image_prompt, with its path in record['image'].
+        """
+        concurrency = max(1, concurrency or self.num_parallel * len(self.pool.backends))
+        prepare_workers = max(1, prepare_workers or os.cpu_count() or 1)
+        model = model_override or self.vision_model
+        cancel = threading.Event()
+        source = enumerate(images)
+        exhausted = False
+
+        preparing = {}   # future -> index
+        ready = deque()  # (index, half, payload, labels) waiting for an inference slot
+        inferring = {}   # future -> (index, half, labels)
+        images_by_index = {}
+        halves = {}      # index -> {half: (text, ok)}
+        started = {}     # index -> when its image was queued for inference
+        analysing = {}   # sha256 -> index of the image with that content being analysed
+        hash_by_index = {}
+        duplicates = {}  # index -> indexes of identical images waiting on its result
+        first_by_hash = {}   # sha256 -> index of the first image with that content, once finished
+        recent = OrderedDict()  # sha256 -> (breakdown, error) of the last BREAKDOWN_RESULTS_KEPT finished
+        reanalysed = {}  # index -> first identical image, for duplicates whose breakdown was no longer kept
+
+        def prepare(image):
+            data = read_image(image)
+            return hashlib.sha256(data).hexdigest(), self.image_preprocessor.encode(data)
+
+        def result_for(index, sha256=None, breakdown=None, duplicate_of=None, error=None):
+            result = {'index': index, 'image': images_by_index.pop(index, None), 'sha256': sha256,
+                      'subject': None, 'background': None, 'combined': None, 'partial': False}
+            result.update(breakdown or {})
+            result.update({'duplicate_of': duplicate_of, 'error': error})
+            return result
+
+        prepare_pool = ThreadPoolExecutor(max_workers=prepare_workers, thread_name_prefix="breakdown-prepare")
+        inference_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="breakdown-infer")
+        try:
+            while True:
+                # Keep the CPU stage ahead of inference, within bounds
+                while not exhausted and len(preparing) + len(ready) // 2 < 2 * concurrency:
+                    try:
+                        index, image = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    images_by_index[index] = image if isinstance(image, (str, os.PathLike)) else None
+                    preparing[prepare_pool.submit(prepare, image)] = index
+
+                while ready and len(inferring) < concurrency:
+                    index, half, payload, labels = ready.popleft()
+                    future = inference_pool.submit(self._run_breakdown_part, payload, use_cache, None, labels,
+                                                   timeouts, cancel)
+                    inferring[future] = (index, half, labels)
+
+                if not preparing and not inferring:
+                    break
+
+                done, _ = wait(list(preparing) + list(inferring), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in preparing:
+                        index = preparing.pop(future)
+                        try:
+                            sha256, encoded = future.result()
+                        except Exception as e:
+                            yield result_for(index, error=self._format_error(e))
+                            continue
+
+                        if sha256 in recent:
+                            recent.move_to_end(sha256)
+                            breakdown, error = recent[sha256]
+                            yield result_for(index, sha256, breakdown, duplicate_of=first_by_hash[sha256],
+                                             error=error)
+                            continue
+                        original = analysing.setdefault(sha256, index)
+                        if original != index:
+                            duplicates.setdefault(original, []).append(index)
+                            continue
+                        if sha256 in first_by_hash:
+                            reanalysed[index] = first_by_hash[sha256]
+
+                        hash_by_index[index] = sha256
+                        subject_payload, background_payload = self._build_breakdown_payloads(
+                            user_input, encoded, prompt_type, model, word_limit, target_model
+                        )
+                        labels = self._metric_labels(subject_payload, prompt_type, target_model, "breakdown")
+                        halves[index] = {}
+                        started[index] = time.perf_counter()
+                        ready.append((index, 'subject', subject_payload, labels))
+                        ready.append((index, 'background', background_payload, labels))
+                    else:
+                        index, half, labels = inferring.pop(future)
+                        halves[index][half] = future.result()
+                        if len(halves[index]) < 2:
+                            continue
+
+                        parts = halves.pop(index)
+                        breakdown = self._combine_breakdown(*parts['subject'], *parts['background'])
+                        # Both halves failing fails the image
+                        error = None if parts['subject'][1] or parts['background'][1] else breakdown['combined']
+                        sha256 = hash_by_index.pop(index)
+                        del analysing[sha256]
+                        original = reanalysed.pop(index, None)
+                        first_by_hash.setdefault(sha256, index)
+                        recent[sha256] = (breakdown, error)
+                        while len(recent) > BREAKDOWN_RESULTS_KEPT:
+                            recent.popitem(last=False)
+                        started_at = started.pop(index)
+                        if error is None and original is None:
+                            image = images_by_index.get(index)
+                            self._record_history(
+                                record, labels, user_input, breakdown['combined'], started_at,
+                                extra=dict(self._breakdown_fields(breakdown),
+                                           image=os.fspath(image) if image is not None else None)
+                            )
+                        yield result_for(index, sha256, breakdown, duplicate_of=original, error=error)
+                        for duplicate in duplicates.pop(index, []):
+                            yield result_for(duplicate, sha256, breakdown, duplicate_of=first_by_hash[sha256],
+                                             error=error)
+        finally:
+            cancel.set()
+            prepare_pool.shutdown(wait=False, cancel_futures=True)
+            inference_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def print_stream(tokens: Iterator[str]):
+    """Print streamed tokens as they arrive"""
+    for token in tokens:
+        print(token, end="", flush=True)
+    print()
+
+
+def run_session_turn(generator: PromptGenerator,
+                     session: PromptSession,
+                     text: str,
+                     image_path: Optional[str] = None,
+                     stream: bool = False):
+    """Run one refinement turn and print the resulting prompt"""
+    print("\n" + "=" * 60)
+    print("GENERATED PROMPT:")
+    print("=" * 60)
+    if stream:
+        print_stream(generator.refine_prompt_stream(session, text, image_path=image_path))
+    else:
+        print(generator.refine_prompt(session, text, image_path=image_path))
+    print("=" * 60)
+
+
+def interactive_mode(stream: bool = False, ollama_host: str = None):
     """Run in interactive mode"""
     print("=" * 60)
     print("Uncensored Prompt Generator - Ollama Edition")
     print("=" * 60)
 
-    generator = PromptGenerator()
+    generator = PromptGenerator(ollama_host=ollama_host, history_source="cli")
 
     # Check Ollama connection
     print("\nChecking Ollama connection...")
@@ -515,6 +2240,9 @@ def interactive_mode():
     print("  /img - Switch to image prompt mode")
     print("  /model [name] - Override model")
     print("  /list - List all available models")
+    print("  /refine [change] - Refine the last prompt (e.g. /refine more dramatic lighting)")
+    print("  /enhance [style] - Add more vivid details to the last prompt")
+    print("  /stream - Toggle token streaming")
     print("  /clear - Clear reference image")
     print("  /quit - Exit")
     print("=" * 60 + "\n")
@@ -523,6 +2251,7 @@ def interactive_mode():
     reference_image = None
     prompt_type = "image"
     model_override = None
+    session = None  # Refinement session for the last generated prompt
 
     while True:
         try:
@@ -555,6 +2284,24 @@ def interactive_mode():
                 elif command == '/img':
                     prompt_type = "image"
                     print("✓ Switched to IMAGE prompt mode")
+                elif command == '/stream':
+                    stream = not stream
+                    print(f"✓ Streaming {'enabled' if stream else 'disabled'}")
+                elif command in ('/refine', '/enhance'):
+                    if session is None or session.last_prompt is None:
+                        print("❌ Generate a prompt first")
+                        continue
+                    if command == '/refine':
+                        if len(parts) < 2:
+                            print("❌ Describe the change, e.g. /refine more dramatic lighting")
+                            continue
+                        change = parts[1].strip()
+                    else:
+                        change = "more vivid details"
+                        if len(parts) > 1:
+                            change += f" in {parts[1].strip()} style"
+                    print(f"\n🔄 Refining prompt (turn {session.turns + 1})...")
+                    run_session_turn(generator, session, change, stream=stream)
                 elif command == '/model' and len(parts) > 1:
                     model_override = parts[1].strip()
                     print(f"✓ Model override set: {model_override}")
@@ -572,20 +2319,10 @@ def interactive_mode():
                     print("❌ Unknown command or missing argument")
                 continue
 
-            # Generate prompt
+            # Generate prompt, starting a new refinement session
             print("\n🔄 Generating prompt...")
-            result = generator.generate_prompt(
-                user_input,
-                prompt_type=prompt_type,
-                image_path=reference_image,
-                model_override=model_override
-            )
-
-            print("\n" + "=" * 60)
-            print("GENERATED PROMPT:")
-            print("=" * 60)
-            print(result)
-            print("=" * 60)
+            session = generator.start_session(prompt_type=prompt_type, model_override=model_override)
+            run_session_turn(generator, session, user_input, image_path=reference_image, stream=stream)
 
         except KeyboardInterrupt:
             print("\n\nGoodbye!")
@@ -595,11 +2332,26 @@ def interactive_mode():
 
 
 def cli_mode(args):
-    """Run in CLI mode with arguments"""
+    """Run in CLI mode with arguments (`batch ...` and `breakdown ...` run bulk jobs, see batch.py;
+    `history ...` searches past results, see history.py)"""
     import argparse
 
+    if args and args[0] == "batch":
+        from batch import batch_mode
+        batch_mode(args[1:])
+        return
+    if args and args[0] == "breakdown":
+        from batch import breakdown_mode
+        breakdown_mode(args[1:])
+        return
+    if args and args[0] == "history":
+        from history import history_mode
+        history_mode(args[1:])
+        return
+
     parser = argparse.ArgumentParser(description="Generate uncensored image/video prompts")
-    parser.add_argument("prompt", help="Your prompt request")
+    parser.add_argument("prompt", nargs="?",
+                       help="Your prompt request (omit to start interactive mode)")
     parser.add_argument("-t", "--type", choices=["image", "video"], default="image",
                        help="Prompt type (default: image)")
     parser.add_argument("-i", "--image", help="Reference image path")
@@ -607,19 +2359,43 @@ def cli_mode(args):
     parser.add_argument("--host", default=None,
                        help="Ollama host (default: env OLLAMA_HOST or http://localhost:11434)")
 
+    parser.add_argument("--stream", action="store_true",
+                       help="Print tokens as they are generated")
+    parser.add_argument("--fresh", action="store_true",
+                       help="Ignore the response cache and sample a new result")
+
     parsed_args = parser.parse_args(args)
 
-    generator = PromptGenerator(ollama_host=parsed_args.host)
+    if parsed_args.prompt is None:
+        interactive_mode(stream=parsed_args.stream, ollama_host=parsed_args.host)
+        return
+
+    generator = PromptGenerator(ollama_host=parsed_args.host, history_source="cli")
 
     if not generator.check_ollama_connection():
-        print("❌ Cannot connect to Ollama at", parsed_args.host)
+        print("❌ Cannot connect to Ollama at", generator.ollama_host)
         sys.exit(1)
 
+    if parsed_args.stream:
+        try:
+            print_stream(generator.generate_prompt_stream(
+                parsed_args.prompt,
+                prompt_type=parsed_args.type,
+                image_path=parsed_args.image,
+                model_override=parsed_args.model,
+                use_cache=not parsed_args.fresh
+            ))
+        except Exception as e:
+            print(f"\nError generating prompt: {str(e)}")
+            sys.exit(1)
+        return
+
     result = generator.generate_prompt(
         parsed_args.prompt,
         prompt_type=parsed_args.type,
         image_path=parsed_args.image,
-        model_override=parsed_args.model
+        model_override=parsed_args.model,
+        use_cache=not parsed_args.fresh
     )
 
     print(result)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed response cache for Ollama generations
+A bounded in-memory LRU in front of a persistent SQLite store
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Payload fields that do not change the generated text
+IGNORED_FIELDS = ("stream", "keep_alive")
+
+
+def payload_key(payload: dict) -> str:
+    """Hash an /api/generate payload, with images reduced to their content hash"""
+    canonical = {k: v for k, v in payload.items() if k not in IGNORED_FIELDS}
+    if canonical.get("images"):
+        canonical["images"] = [hashlib.sha256(image.encode("utf-8")).hexdigest()
+                               for image in canonical["images"]]
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of Ollama results keyed by payload_key().
+
+    The memory tier holds up to memory_items entries. The disk tier
+    (skipped when path is None) expires entries after ttl seconds and
+    evicts least recently used entries once it grows past max_bytes.
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 memory_items: int = 256,
+                 ttl: float = 7 * 24 * 3600,
+                 max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._db = None
+
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                size INTEGER NOT NULL
+            )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build a cache from PROMPT_CACHE_* environment variables, or None if disabled"""
+        path = os.getenv("PROMPT_CACHE_PATH")
+        if not path:
+            return None
+        return cls(
+            path=None if path == ":memory:" else path,
+            memory_items=int(os.getenv("PROMPT_CACHE_MEMORY_ITEMS", "256")),
+            ttl=float(os.getenv("PROMPT_CACHE_TTL", str(7 * 24 * 3600))),
+            max_bytes=int(float(os.getenv("PROMPT_CACHE_MAX_MB", "100")) * 1024 * 1024)
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a copy of the cached result, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    return dict(value)
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            return dict(value)
+
+    def put(self, key: str, value: dict):
+        """Store a result in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, dict(value))
+
+            if self._db is None:
+                return
+
+            encoded = json.dumps(value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, now, now, len(encoded))
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, created: float, value: dict):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used until under max_bytes"""
+        self._db.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Semantic response cache
+Finds earlier requests that mean the same thing as a new one ("cyberpunk
+street at night" / "night cyberpunk street") by comparing Ollama
+embeddings, so their prompt can be reused instead of regenerated
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# What a match above the threshold is used for
+RETURN = "return"    # answer with the stored prompt instead of generating
+SUGGEST = "suggest"  # generate anyway; callers may offer the match alongside
+MODES = (RETURN, SUGGEST)
+
+
+class _Index:
+    """Unit vectors of one bucket's requests in a growable NumPy matrix"""
+
+    def __init__(self, dimensions: int):
+        self.vectors = np.zeros((16, dimensions), dtype=np.float32)
+        self.accessed = np.zeros(16, dtype=np.float64)
+        self.entries = []  # (id, input, response), row for row with vectors
+        self.last_id = 0   # Highest stored id loaded, for picking up other processes' entries
+        self.stored = 0    # Stored rows accounted for, including ones with unusable embeddings
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, entry_id: int, vector, user_input: str, response: str, accessed: float):
+        size = len(self.entries)
+        if size == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.accessed = np.concatenate([self.accessed, np.zeros_like(self.accessed)])
+        self.vectors[size] = vector
+        self.accessed[size] = accessed
+        self.entries.append((entry_id, user_input, response))
+        self.last_id = max(self.last_id, entry_id)
+        self.stored += 1
+
+    def nearest(self, vector) -> tuple:
+        """(row, cosine similarity) of the closest entry"""
+        similarities = self.vectors[:len(self.entries)] @ vector
+        row = int(np.argmax(similarities))
+        return row, float(similarities[row])
+
+    def remove(self, row: int) -> int:
+        """Drop a row (moving the last one into its place) and return its entry id"""
+        last = len(self.entries) - 1
+        entry_id = self.entries[row][0]
+        self.vectors[row] = self.vectors[last]
+        self.accessed[row] = self.accessed[last]
+        self.entries[row] = self.entries[last]
+        self.entries.pop()
+        self.stored -= 1
+        return entry_id
+
+    def discard(self, entry_ids: set):
+        """Drop the rows of the given entry ids"""
+        for row in reversed(range(len(self.entries))):
+            if self.entries[row][0] in entry_ids:
+                self.remove(row)
+
+    def least_recently_used(self) -> int:
+        return int(np.argmin(self.accessed[:len(self.entries)]))
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of prompts keyed by request embeddings.
+
+    Requests are grouped into buckets (see bucket_key) so only requests
+    for the same generation settings are compared. A stored prompt whose
+    request has a cosine similarity of at least threshold with the new
+    one is a match. Each bucket keeps its max_items most recently used
+    entries; entries persist in the SQLite file at path (None keeps them
+    in memory only) and are loaded lazily, per bucket. The file is the
+    source of truth when several processes share it: recency is recorded
+    there and eviction happens there, and each process reloads a bucket
+    once its rows no longer match what it has loaded. Needs NumPy.
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 model: str = "nomic-embed-text",
+                 threshold: float = 0.9,
+                 max_items: int = 1000,
+                 mode: str = RETURN,
+                 embedding_items: int = 256):
+        if np is None:
+            raise RuntimeError("The semantic cache needs NumPy: pip install numpy")
+        if mode not in MODES:
+            raise ValueError(f"Unsupported semantic cache mode: {mode}")
+
+        self.path = path
+        self.model = model
+        self.threshold = threshold
+        self.max_items = max_items
+        self.mode = mode
+        self.embedding_items = embedding_items
+
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._embeddings = OrderedDict()
+        self._next_id = 1  # For memory-only entries
+        self._db = None
+
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bucket TEXT NOT NULL,
+                input TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_bucket ON entries (bucket, id)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        """Build a cache from PROMPT_SEMANTIC_* environment variables, or None if disabled"""
+        path = os.getenv("PROMPT_SEMANTIC_CACHE")
+        if not path:
+            return None
+        if np is None:
+            print("Warning: NumPy is not installed, the semantic cache is disabled")
+            return None
+        return cls(
+            path=None if path == ":memory:" else path,
+            model=os.getenv("PROMPT_SEMANTIC_MODEL", "nomic-embed-text"),
+            threshold=float(os.getenv("PROMPT_SEMANTIC_THRESHOLD", "0.9")),
+            max_items=int(os.getenv("PROMPT_SEMANTIC_MAX_ITEMS", "1000")),
+            mode=os.getenv("PROMPT_SEMANTIC_MODE", RETURN).lower()
+        )
+
+    def bucket_key(self, prompt_type: str, target_model: str, model: str, word_limit: int) -> str:
+        """Requests are only compared with others that share these settings (and embedding model)"""
+        return "|".join((self.model, model or "", prompt_type.lower(), target_model, str(word_limit)))
+
+    def embedding(self, text: str):
+        """A recently computed unit vector for text, or None"""
+        with self._lock:
+            vector = self._embeddings.get(text)
+            if vector is not None:
+                self._embeddings.move_to_end(text)
+            return vector
+
+    def remember_embedding(self, text: str, embedding: list):
+        """Normalise an embedding from Ollama, keep it for reuse and return it (None if unusable)"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if vector.ndim != 1 or not norm:
+            return None
+        vector /= norm
+        with self._lock:
+            self._embeddings[text] = vector
+            self._embeddings.move_to_end(text)
+            while len(self._embeddings) > self.embedding_items:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def lookup(self, bucket: str, vector) -> Optional[dict]:
+        """Return {'input', 'response', 'similarity'} of the closest match at or above threshold"""
+        with self._lock:
+            index = self._index(bucket, len(vector))
+            if index is None or not len(index):
+                return None
+            row, similarity = index.nearest(vector)
+            if similarity < self.threshold:
+                return None
+
+            now = time.time()
+            index.accessed[row] = now
+            entry_id, user_input, response = index.entries[row]
+            if self._db is not None:
+                self._db.execute("UPDATE entries SET accessed = ? WHERE id = ?", (now, entry_id))
+                self._db.commit()
+            return {'input': user_input, 'response': response, 'similarity': round(similarity, 4)}
+
+    def add(self, bucket: str, vector, user_input: str, response: str):
+        """Store a generated prompt under its request's embedding"""
+        now = time.time()
+        with self._lock:
+            index = self._index(bucket, len(vector))
+            if index is None:
+                return
+
+            if self._db is None:
+                index.add(self._next_id, vector, user_input, response, now)
+                self._next_id += 1
+                while len(index) > self.max_items:
+                    index.remove(index.least_recently_used())
+                return
+
+            entry_id = self._db.execute(
+                "INSERT INTO entries (bucket, input, response, embedding, accessed) VALUES (?, ?, ?, ?, ?)",
+                (bucket, user_input, response, vector.astype(np.float32).tobytes(), now)
+            ).lastrowid
+            index.add(entry_id, vector, user_input, response, now)
+
+            # Evict by the access times every process records in the file, not just this one's
+            doomed = [row[0] for row in self._db.execute(
+                "SELECT id FROM entries WHERE bucket = ? ORDER BY accessed DESC, id DESC LIMIT -1 OFFSET ?",
+                (bucket, self.max_items)
+            )]
+            if doomed:
+                self._db.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in doomed])
+                index.discard(set(doomed))
+            self._db.commit()
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._indexes.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _index(self, bucket: str, dimensions: int) -> Optional[_Index]:
+        """The bucket's index, brought in line with the entries other processes stored or removed"""
+        index = self._indexes.get(bucket)
+        if index is None:
+            index = self._indexes[bucket] = _Index(dimensions)
+        if index.vectors.shape[1] != dimensions:
+            # Embeddings from another model cannot be compared
+            return None
+
+        if self._db is None:
+            return index
+
+        # Ids are never reused, so an unchanged count and highest id mean nothing changed
+        count, max_id = self._db.execute(
+            "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM entries WHERE bucket = ?", (bucket,)
+        ).fetchone()
+        if count == index.stored and max_id == index.last_id:
+            return index
+
+        query = "SELECT id, input, response, embedding, accessed FROM entries WHERE bucket = ? AND id > ? ORDER BY id"
+        rows = self._db.execute(query, (bucket, index.last_id)).fetchall()
+        if index.stored + len(rows) != count:
+            # Entries were evicted or cleared elsewhere: reload the bucket
+            index = self._indexes[bucket] = _Index(dimensions)
+            rows = self._db.execute(query, (bucket, 0)).fetchall()
+        for entry_id, user_input, response, embedding, accessed in rows:
+            vector = np.frombuffer(embedding, dtype=np.float32)
+            if len(vector) == dimensions:
+                index.add(entry_id, vector, user_input, response, accessed)
+            else:
+                index.stored += 1
+                index.last_id = max(index.last_id, entry_id)
+        return index
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Refinement sessions
+Carry Ollama's conversation context across prompt refinement turns so
+follow-up edits only cost their own tokens
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+
+class PromptSession:
+    """State of one prompt being refined over several turns.
+
+    context holds the token context Ollama returned for the last turn;
+    sending it back lets the server reuse the evaluated prefix. Once it
+    grows past max_context tokens it is dropped and the next turn starts
+    over from last_prompt.
+    """
+
+    def __init__(self,
+                 prompt_type: str = "image",
+                 target_model: str = "stable-diffusion",
+                 word_limit: int = 50,
+                 model: Optional[str] = None,
+                 last_prompt: Optional[str] = None,
+                 max_context: int = 4096):
+        self.id = uuid.uuid4().hex
+        self.prompt_type = prompt_type
+        self.target_model = target_model
+        self.word_limit = word_limit
+        self.model = model
+        self.last_prompt = last_prompt
+        self.max_context = max_context
+        self.context = None
+        self.turns = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()  # One turn at a time
+
+    def update(self, model: str, prompt: str, context: Optional[list]):
+        """Record the outcome of a turn"""
+        self.model = model
+        self.last_prompt = prompt
+        self.context = context if context and len(context) <= self.max_context else None
+        self.turns += 1
+        self.last_used = time.monotonic()
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'prompt_type': self.prompt_type,
+            'target_model': self.target_model,
+            'model': self.model,
+            'turns': self.turns,
+            'last_prompt': self.last_prompt,
+            'context_tokens': len(self.context) if self.context else 0
+        }
+
+
+class SessionStore:
+    """Bounded, thread-safe map of session id to PromptSession.
+
+    Sessions idle for longer than ttl seconds expire, and the least
+    recently used are dropped beyond max_sessions.
+    """
+
+    def __init__(self, max_sessions: int = 256, ttl: float = 1800, max_context: int = 4096):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_context = max_context
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """Build a store from PROMPT_SESSION_* environment variables"""
+        return cls(
+            max_sessions=int(os.getenv("PROMPT_SESSION_MAX", "256")),
+            ttl=float(os.getenv("PROMPT_SESSION_TTL", "1800")),
+            max_context=int(os.getenv("PROMPT_SESSION_MAX_CONTEXT", "4096"))
+        )
+
+    def create(self, **kwargs) -> PromptSession:
+        """Start and store a new session (arguments as for PromptSession)"""
+        kwargs.setdefault('max_context', self.max_context)
+        session = PromptSession(**kwargs)
+        with self._lock:
+            self._expire(time.monotonic())
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[PromptSession]:
+        """Return a live session and mark it used, or None if unknown or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _expire(self, now: float):
+        expired = [session_id for session_id, session in self._sessions.items()
+                   if now - session.last_used >= self.ttl]
+        for session_id in expired:
+            del self._sessions[session_id]
@@ -4,22 +4,106 @@
 Web UI for Uncensored Prompt Generator with Image Upload Support
 """
 
-from flask import Flask, render_template_string, request, jsonify
-from prompt_generator import PromptGenerator
-from werkzeug.utils import secure_filename
+from flask import Flask, Request, Response, render_template_string, request, jsonify, stream_with_context
+from prompt_generator import MODELS_PENDING, MODELS_RESOLVING, CircuitOpenError, PromptGenerator, Timeouts
+from jobs import JobManager
+from semantic_cache import SUGGEST
+from ollama_pool import parse_hosts
+from tempfile import SpooledTemporaryFile
+import functools
+import json
 import os
-import uuid
+import select
+import socket
+import time
+
+class UploadRequest(Request):
+    """Request that keeps uploads in memory, spooling to disk only above UPLOAD_SPOOL_SIZE"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_SIZE'], mode='rb+')
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = '/app/images/uploads'
-
-# Create upload folder if it doesn't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+app.config['UPLOAD_SPOOL_SIZE'] = int(os.getenv('UPLOAD_SPOOL_SIZE', 4 * 1024 * 1024))
+app.config['WARM_UP'] = os.getenv('OLLAMA_WARM_UP', '1') != '0'
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
-generator = PromptGenerator()
+generator = PromptGenerator(history_source="web")
+jobs = JobManager.from_env()
+
+def reset_generator():
+    """Give this process its own PromptGenerator (called in each WSGI worker after fork)"""
+    global generator
+    generator.close()
+    generator = PromptGenerator(history_source="web")
+
+def start_model_warmers():
+    """Detect the default models in the background, then preload them and start the
+    keep-warm pinger (when configured); requests are served meanwhile"""
+    generator.start_model_resolver()
+    if app.config['WARM_UP']:
+        generator.warm_up(wait=False)
+    generator.start_keep_warm()
+
+def models_ready() -> bool:
+    """Whether the default models have been detected (or fell back), so model info is answered without waiting"""
+    state = generator.model_status()['state']
+    if state == MODELS_PENDING:
+        # Served without start_model_warmers() (e.g. by another WSGI server)
+        generator.start_model_resolver()
+    return state not in (MODELS_PENDING, MODELS_RESOLVING)
+
+def fail_fast(view):
+    """Answer 503 straight away, instead of queueing the request, while Ollama's circuit is open"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not generator.breaker.available():
+            return circuit_open_response(CircuitOpenError(generator.breaker.status()))
+        return view(*args, **kwargs)
+    return wrapper
+
+def circuit_open_response(error: CircuitOpenError):
+    response = jsonify(error.to_dict())
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+class ClientDisconnect:
+    """Cancellation flag for a generation that is set once the HTTP client hangs up.
+
+    Pass it as cancel= to the generator: is_set() peeks at the client's
+    socket (as exposed by the dev server and gunicorn), at most every
+    `interval` seconds, and reports True once the client has closed it.
+    """
+
+    def __init__(self, environ: dict, interval: float = 0.25):
+        self.sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+        self.interval = interval
+        self._closed = False
+        self._checked = 0.0
+
+    def is_set(self) -> bool:
+        if self._closed or self.sock is None:
+            return self._closed
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return False
+        self._checked = now
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            # Readable with nothing to read means the client closed the connection
+            if readable and not self.sock.recv(1, socket.MSG_PEEK):
+                self._closed = True
+        except ValueError:
+            self.sock = None  # TLS sockets cannot be peeked at
+        except OSError:
+            self._closed = True
+        if self._closed:
+            print("🔌 Client disconnected, cancelling generation")
+        return self._closed
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -946,12 +1030,15 @@ HTML_TEMPLATE = """
                     if (seed) formData.append('seed', seed);
                 }
 
-                const response = await fetch('/api/generate', {
-                    method: 'POST',
-                    body: formData
-                });
+                // Stream single prompts token by token; breakdown mode needs the full JSON response
+                if (!(uploadedFile && breakdownMode)) {
+                    await streamPrompt(formData);
+                    return;
+                }
 
-                const data = await response.json();
+                // Breakdown runs two vision calls, so submit it as a job and poll
+                // instead of holding one long request open
+                const { response, data } = await runJob(formData);
 
                 if (response.ok) {
                     document.getElementById('loading').classList.remove('show');
@@ -960,10 +1047,7 @@ HTML_TEMPLATE = """
                     let resultHTML = '';
 
                     if (data.seed) {
-                        resultHTML += `<div style="background: #fff3cd; padding: 10px; border-radius: 5px; margin-bottom: 15px; border-left: 4px solid #ffc107;">
-                            <strong>🎯 Consistency Seed:</strong> <code style="background: white; padding: 2px 8px; border-radius: 3px; font-size: 1.1em;">${data.seed}</code>
-                            <br><small style="color: #856404;">Copy this seed and use it in your image generator's seed field</small>
-                        </div>`;
+                        resultHTML += seedHTML(data.seed);
                     }
 
                     // Check if breakdown mode returned multiple prompts
@@ -1014,6 +1098,91 @@ HTML_TEMPLATE = """
             }
         });
 
+        // Render the consistency seed banner
+        function seedHTML(seed) {
+            return `<div style="background: #fff3cd; padding: 10px; border-radius: 5px; margin-bottom: 15px; border-left: 4px solid #ffc107;">
+                <strong>🎯 Consistency Seed:</strong> <code style="background: white; padding: 2px 8px; border-radius: 3px; font-size: 1.1em;">${seed}</code>
+                <br><small style="color: #856404;">Copy this seed and use it in your image generator's seed field</small>
+            </div>`;
+        }
+
+        // Submit a generation job and poll until it finishes
+        async function runJob(formData) {
+            const submitted = await fetch('/api/jobs', {
+                method: 'POST',
+                body: formData
+            });
+            const job = await submitted.json();
+            if (!submitted.ok) return { response: submitted, data: job };
+
+            // The server fails jobs past JOBS_TIMEOUT; stop polling a little after that
+            // (or after an hour when it has no limit) in case no one is left to answer
+            const deadline = Date.now() + ((job.timeout || 3600) + 30) * 1000;
+            while (Date.now() < deadline) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const response = await fetch(job.url);
+                const status = await response.json();
+                if (!response.ok) return { response, data: status };
+                if (status.status === 'done') return { response, data: status.result };
+                if (status.status === 'failed') return { response: { ok: false }, data: { error: status.error } };
+            }
+            return { response: { ok: false }, data: { error: 'Gave up waiting for the job to finish' } };
+        }
+
+        // Generate via the Server-Sent Events endpoint, showing tokens as they arrive
+        async function streamPrompt(formData) {
+            const response = await fetch('/api/generate/stream', {
+                method: 'POST',
+                body: formData
+            });
+
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.error || 'Generation failed');
+            }
+
+            const resultText = document.getElementById('resultText');
+            resultText.innerHTML = '<div class="prompt-output"></div>';
+            const output = resultText.querySelector('.prompt-output');
+            document.getElementById('loading').classList.remove('show');
+            document.getElementById('result').classList.add('show');
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventType = 'message';
+                    let payload = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event: ')) eventType = line.slice(7);
+                        else if (line.startsWith('data: ')) payload += line.slice(6);
+                    });
+                    const data = JSON.parse(payload);
+
+                    if (eventType === 'error') {
+                        throw new Error(data.error || 'Generation failed');
+                    } else if (eventType === 'done') {
+                        window.currentPrompt = data.result;
+                        output.textContent = data.result;
+                        if (data.seed) output.insertAdjacentHTML('beforebegin', seedHTML(data.seed));
+                    } else {
+                        output.textContent += data.token;
+                    }
+                }
+            }
+        }
+
         function copyResult() {
             // Copy only the prompt, not the seed
             const text = window.currentPrompt || document.getElementById('resultText').textContent;
@@ -1189,8 +1358,22 @@ HTML_TEMPLATE = """
 @app.route('/')
 def index():
     """Main page"""
-    models = generator.list_models()
-    connected = generator.check_ollama_connection()
+    if not models_ready():
+        # Do not hold the page up while the first model detection is in flight
+        return render_template_string(
+            HTML_TEMPLATE,
+            status="⏳ Resolving models...",
+            text_model="resolving...",
+            vision_model="resolving...",
+            total_models=0,
+            models=[],
+            ollama_host=generator.ollama_host
+        )
+
+    # As of the background resolver's last fetch, so a hanging Ollama cannot hold the page up
+    resolution = generator.model_status()
+    models = resolution['models']
+    connected = resolution['connected']
 
     return render_template_string(
         HTML_TEMPLATE,
@@ -1202,113 +1385,356 @@ def index():
         ollama_host=generator.ollama_host
     )
 
+def parse_generate_request():
+    """Read generation parameters from a JSON or multipart/form-data request"""
+    # Handle both JSON and multipart/form-data
+    if request.is_json:
+        data = request.json
+        image_file = None
+    else:
+        data = request.form.to_dict()
+        image_file = request.files.get('image')
+
+    params = {
+        'prompt': data.get('prompt', ''),
+        'prompt_type': data.get('type', 'image'),
+        'target_model': data.get('target_model', 'stable-diffusion'),
+        'model': data.get('model', None) or None,
+        'word_limit': int(data.get('word_limit', 50)),
+        'breakdown_mode': data.get('breakdown_mode') == 'true',
+        'use_cache': data.get('fresh') != 'true',  # fresh=true forces a new sample
+        'coalesce': False if data.get('fresh') == 'true' else None,
+        # early_stop=true/false overrides PROMPT_EARLY_STOP for this request
+        'early_stop': {'true': True, 'false': False}.get(str(data.get('early_stop', '')).lower()),
+        'timeouts': parse_timeouts(data),
+        'seed': None
+    }
+
+    # Handle consistency mode
+    if params['prompt'] and data.get('consistency_mode') == 'true':
+        seed = data.get('seed', '')
+        # Generate random seed if not provided
+        if not seed:
+            import random
+            seed = str(random.randint(1000000000, 9999999999))
+        params['seed'] = seed
+
+        # Add consistency keywords to prompt
+        consistency_keywords = "same character, consistent character design, character reference, same style, same person"
+        params['prompt'] = f"{params['prompt']}, {consistency_keywords}"
+        print(f"🎯 Consistency Mode: seed={seed}")
+
+    return params, image_file
+
+def parse_timeouts(data) -> Timeouts:
+    """Per-request 'timeout' (whole generation) and 'first_token_timeout' in seconds, else the defaults"""
+    defaults = generator.timeouts
+    return Timeouts(
+        connect=defaults.connect,
+        first_token=parse_seconds(data, 'first_token_timeout', defaults.first_token),
+        total=parse_seconds(data, 'timeout', defaults.total)
+    )
+
+def parse_seconds(data, field: str, default: float) -> float:
+    """A non-negative number of seconds from the request, else default; ValueError if malformed"""
+    value = data.get(field)
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be a number of seconds")
+    if not seconds >= 0:  # Also rejects NaN
+        raise ValueError(f"'{field}' must not be negative")
+    return seconds
+
+def get_upload(image_file):
+    """Return the uploaded image stream for the generator (or None if not an allowed image)"""
+    if not image_file or not allowed_file(image_file.filename):
+        return None
+
+    print(f"📸 Image uploaded: {image_file.filename}")
+    return image_file.stream
+
+def suggest_similar(params: dict, image):
+    """An earlier prompt for a request meaning the same, offered next to the fresh one (PROMPT_SEMANTIC_MODE=suggest)"""
+    cache = generator.semantic_cache
+    if cache is None or cache.mode != SUGGEST or image is not None or params['breakdown_mode']:
+        return None
+    return generator.find_similar(params['prompt'], prompt_type=params['prompt_type'], model_override=params['model'],
+                                  word_limit=params['word_limit'], target_model=params['target_model'])
+
+def run_generation(params: dict, image, cancel=None) -> dict:
+    """Run a parsed generation request and build the /api/generate response body
+
+    cancel (a ClientDisconnect or threading.Event) abandons the upstream
+    generation once set.
+    """
+    # Generate prompt - check if breakdown mode is enabled
+    if params['breakdown_mode'] and image:
+        # Breakdown mode: generate separate prompts for subject and background
+        breakdown_result = generator.breakdown_image_prompt(
+            params['prompt'],
+            image_path=image,
+            prompt_type=params['prompt_type'],
+            model_override=params['model'],
+            word_limit=params['word_limit'],
+            target_model=params['target_model'],
+            use_cache=params['use_cache'],
+            coalesce=params['coalesce'],
+            timeouts=params['timeouts'],
+            cancel=cancel,
+            record={'seed': params['seed']}
+        )
+
+        response_data = {
+            'subject_prompt': breakdown_result.get('subject'),
+            'background_prompt': breakdown_result.get('background'),
+            'combined_prompt': breakdown_result.get('combined'),
+            'partial': breakdown_result.get('partial', False)
+        }
+    else:
+        # Standard mode: single prompt (looking for a similar earlier one first, so it is not itself)
+        similar = suggest_similar(params, image)
+        result = generator.generate_prompt(
+            params['prompt'],
+            prompt_type=params['prompt_type'],
+            image_path=image,
+            model_override=params['model'],
+            word_limit=params['word_limit'],
+            target_model=params['target_model'],
+            use_cache=params['use_cache'],
+            coalesce=params['coalesce'],
+            early_stop=params['early_stop'],
+            timeouts=params['timeouts'],
+            cancel=cancel,
+            record={'seed': params['seed']}
+        )
+
+        response_data = {'result': result}
+        if similar:
+            response_data['similar'] = similar
+
+    if params['seed']:
+        response_data['seed'] = params['seed']
+
+    return response_data
+
 @app.route('/api/generate', methods=['POST'])
+@fail_fast
 def generate():
     """Generate prompt API endpoint with image support"""
     try:
-        # Handle both JSON and multipart/form-data
-        if request.is_json:
-            data = request.json
-            image_file = None
-        else:
-            data = request.form.to_dict()
-            image_file = request.files.get('image')
-
-        prompt = data.get('prompt', '')
-        prompt_type = data.get('type', 'image')
-        target_model = data.get('target_model', 'stable-diffusion')
-        model = data.get('model', None)
-        consistency_mode = data.get('consistency_mode') == 'true'
-        seed = data.get('seed', '')
-        word_limit = int(data.get('word_limit', 50))
-        breakdown_mode = data.get('breakdown_mode') == 'true'
+        params, image_file = parse_generate_request()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
 
-        if not prompt:
+    try:
+        if not params['prompt']:
             return jsonify({'error': 'Prompt is required'}), 400
 
-        # Handle consistency mode
-        response_seed = None
-        if consistency_mode:
-            # Generate random seed if not provided
-            if not seed:
-                import random
-                seed = str(random.randint(1000000000, 9999999999))
-            response_seed = seed
-
-            # Add consistency keywords to prompt
-            consistency_keywords = "same character, consistent character design, character reference, same style, same person"
-            prompt = f"{prompt}, {consistency_keywords}"
-            print(f"🎯 Consistency Mode: seed={seed}")
-
-        image_path = None
-
-        # Handle uploaded image
-        if image_file and allowed_file(image_file.filename):
-            # Generate unique filename
-            filename = secure_filename(image_file.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-            # Save the file
-            image_file.save(image_path)
-            print(f"📸 Image uploaded: {image_path}")
-
-        # Generate prompt - check if breakdown mode is enabled
-        if breakdown_mode and image_path:
-            # Breakdown mode: generate separate prompts for subject and background
-            breakdown_result = generator.breakdown_image_prompt(
-                prompt,
-                image_path=image_path,
-                prompt_type=prompt_type,
-                model_override=model if model else None,
-                word_limit=word_limit,
-                target_model=target_model
-            )
+        # Handle uploaded image (read straight from the request, never saved)
+        image = get_upload(image_file)
 
-            # Clean up uploaded image
-            if image_path and os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except:
-                    pass
-
-            response_data = {
-                'subject_prompt': breakdown_result.get('subject'),
-                'background_prompt': breakdown_result.get('background'),
-                'combined_prompt': breakdown_result.get('combined')
-            }
-            if response_seed:
-                response_data['seed'] = response_seed
-
-            return jsonify(response_data)
-        else:
-            # Standard mode: single prompt
-            result = generator.generate_prompt(
-                prompt,
-                prompt_type=prompt_type,
-                image_path=image_path,
-                model_override=model if model else None,
-                word_limit=word_limit,
-                target_model=target_model
-            )
+        return jsonify(run_generation(params, image, cancel=ClientDisconnect(request.environ)))
+
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/refine', methods=['POST'])
+@fail_fast
+def refine():
+    """Refine a prompt over several turns, reusing the model's context between them
+
+    Send {'prompt': 'a castle at dusk'} to start a session, then
+    {'session_id': ..., 'prompt': 'more dramatic lighting', 'previous': <last result>}
+    for each follow-up. 'previous' lets a session that expired (or lives in
+    another worker) carry on from the last result instead of failing.
+    """
+    try:
+        params, image_file = parse_generate_request()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
 
-            # Clean up uploaded image
-            if image_path and os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except:
-                    pass
+    try:
+        if not params['prompt']:
+            return jsonify({'error': 'Prompt is required'}), 400
 
-            response_data = {'result': result}
-            if response_seed:
-                response_data['seed'] = response_seed
+        data = request.json if request.is_json else request.form
+        session = generator.sessions.get(data.get('session_id', ''))
+        if session is None:
+            session = generator.start_session(
+                prompt_type=params['prompt_type'],
+                target_model=params['target_model'],
+                word_limit=params['word_limit'],
+                model_override=params['model'],
+                last_prompt=data.get('previous') or None
+            )
 
-            return jsonify(response_data)
+        result = generator.refine_prompt(session, params['prompt'], image_path=get_upload(image_file),
+                                         use_cache=params['use_cache'], timeouts=params['timeouts'],
+                                         cancel=ClientDisconnect(request.environ))
+        return jsonify({'result': result, 'session_id': session.id, 'turns': session.turns})
 
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+@fail_fast
+def submit_job():
+    """Queue a generation (same inputs as /api/generate) and return its job id immediately"""
+    try:
+        params, image_file = parse_generate_request()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not params['prompt']:
+        return jsonify({'error': 'Prompt is required'}), 400
+
+    # The job outlives the request, so keep the upload's bytes
+    image = get_upload(image_file)
+    if image is not None:
+        image = image.read()
+
+    # A job that outlives JOBS_TIMEOUT cancels its generation
+    job_id = jobs.submit(lambda cancel: run_generation(params, image, cancel=cancel))
+    return jsonify({'id': job_id, 'status': 'queued', 'url': f"/api/jobs/{job_id}", 'timeout': jobs.timeout}), 202
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Get a job's status, and its result once done"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a job's status changes as Server-Sent Events until it finishes"""
+    if jobs.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def events():
+        for job in jobs.watch(job_id):
+            yield sse_event(job, event=job['status'])
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Format a Server-Sent Event"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@app.route('/api/generate/stream', methods=['POST'])
+@fail_fast
+def generate_stream():
+    """Stream a generated prompt token by token as Server-Sent Events"""
+    try:
+        params, image_file = parse_generate_request()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not params['prompt']:
+        return jsonify({'error': 'Prompt is required'}), 400
+    if params['breakdown_mode']:
+        return jsonify({'error': 'Breakdown mode is not supported for streaming, use /api/generate'}), 400
+
+    # Read the upload now: request files are closed before the stream body runs
+    image = get_upload(image_file)
+    if image is not None:
+        image = image.read()
+
+    # Writes only fail some time after the client has gone, so also watch its socket
+    disconnect = ClientDisconnect(request.environ)
+
+    def events():
+        tokens = []
+        similar = suggest_similar(params, image)
+        stream = generator.generate_prompt_stream(
+            params['prompt'],
+            prompt_type=params['prompt_type'],
+            image_path=image,
+            model_override=params['model'],
+            word_limit=params['word_limit'],
+            target_model=params['target_model'],
+            use_cache=params['use_cache'],
+            coalesce=params['coalesce'],
+            early_stop=params['early_stop'],
+            timeouts=params['timeouts'],
+            record={'seed': params['seed']}
+        )
+        try:
+            for token in stream:
+                if disconnect.is_set():
+                    return
+                tokens.append(token)
+                yield sse_event({'token': token})
+
+            done = {'result': ''.join(tokens).strip()}
+            if similar:
+                done['similar'] = similar
+            if params['seed']:
+                done['seed'] = params['seed']
+            yield sse_event(done, event='done')
+        except CircuitOpenError as e:
+            yield sse_event(e.to_dict(), event='error')
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
+            yield sse_event({'error': str(e)}, event='error')
+        finally:
+            # Closing the stream closes the upstream request
+            stream.close()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/history')
+def history():
+    """Search past generations, newest first
+
+    ?q= matches words (or word prefixes) in the request or the prompt;
+    target_model, type, mode and source narrow the results. Each page has
+    up to `limit` items; pass its 'next' as ?before= for the next page.
+    """
+    if generator.history is None:
+        return jsonify({'error': 'History is disabled'}), 404
+    try:
+        page = generator.history.search(
+            request.args.get('q', ''),
+            limit=int(request.args.get('limit', 20)),
+            before=int(request.args['before']) if request.args.get('before') else None,
+            target_model=request.args.get('target_model') or None,
+            prompt_type=request.args.get('type') or None,
+            mode=request.args.get('mode') or None,
+            source=request.args.get('source') or None
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@app.route('/api/history/<int:record_id>', methods=['GET', 'DELETE'])
+def history_record(record_id):
+    """Get or delete one history record"""
+    if generator.history is None:
+        return jsonify({'error': 'History is disabled'}), 404
+    if request.method == 'DELETE':
+        if not generator.history.delete(record_id):
+            return jsonify({'error': 'Record not found'}), 404
+        return jsonify({'deleted': record_id})
+    record = generator.history.get(record_id)
+    if record is None:
+        return jsonify({'error': 'Record not found'}), 404
+    return jsonify(record)
+
 @app.route('/api/models')
 def models():
     """List available models"""
@@ -1316,15 +1742,25 @@ def models():
 
 @app.route('/api/status')
 def status():
-    """Check status"""
+    """Check status without waiting on Ollama: connection and models are as of the background resolver's last fetch"""
+    resolution = generator.model_status()
+    ready = models_ready()
     return jsonify({
-        'connected': generator.check_ollama_connection(),
+        'connected': resolution['connected'] if ready else None,
         'ollama_host': generator.ollama_host,
-        'text_model': generator.text_model,
-        'vision_model': generator.vision_model,
-        'models': generator.list_models()
+        'text_model': resolution['text_model'],
+        'vision_model': resolution['vision_model'],
+        'models_state': resolution['state'],
+        'models': resolution['models'] if ready else [],
+        'backends': generator.pool.status(),
+        'circuit': generator.breaker.status()
     })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Generation counters and latency histograms in Prometheus text format (per worker process)"""
+    return Response(generator.metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/test-connection', methods=['GET', 'POST'])
 def test_connection():
     """Test Ollama connection with detailed diagnostics"""
@@ -1335,8 +1771,8 @@ def test_connection():
         if test_url:
             # Create temporary generator to test the URL
             from prompt_generator import PromptGenerator
-            temp_generator = PromptGenerator(ollama_host=test_url)
-            result = temp_generator.test_ollama_connection()
+            with PromptGenerator(ollama_host=test_url) as temp_generator:
+                result = temp_generator.test_ollama_connection()
             return jsonify(result)
 
     # GET request - test current connection
@@ -1360,8 +1796,8 @@ def ollama_url_setting():
     if not new_url:
         return jsonify({'error': 'URL is required'}), 400
 
-    # Validate URL format
-    if not new_url.startswith('http://') and not new_url.startswith('https://'):
+    # Validate URL format (several hosts may be given, comma-separated)
+    if not all(host.startswith(('http://', 'https://')) for host in parse_hosts(new_url)):
         return jsonify({'error': 'URL must start with http:// or https://'}), 400
 
     result = generator.set_ollama_host(new_url)
@@ -1378,7 +1814,6 @@ if __name__ == '__main__':
     print(f"🚀 Starting Prompt Generator Web UI on port {port}")
     print(f"🔗 Open: http://localhost:{port}")
     print(f"🔗 Ollama: {generator.ollama_host}")
-    print(f"📝 Text Model: {generator.text_model}")
-    print(f"📸 Vision Model: {generator.vision_model}")
-    print(f"📁 Upload folder: {app.config['UPLOAD_FOLDER']}")
+    print("📝 Detecting default models in the background...")
+    start_model_warmers()
     app.run(host='0.0.0.0', port=port, debug=False)